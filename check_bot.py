@@ -3,69 +3,127 @@
 Check bot via Telegram API
 """
 
-import requests
-import sys
+import asyncio
+import importlib.util
+import httpx
 import os
+import sys
+import time
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json keeps the script portable
+    import json as orjson
 
-# Add current directory to path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from telegram_api import GET_ME, GET_WEBHOOK_INFO
 
-from config import TELEGRAM_BOT_TOKEN
+# HTTP/2 multiplexes both checks over one connection; it needs the optional h2 package
+_HTTP2 = importlib.util.find_spec("h2") is not None
 
-def check_bot():
+# getWebhookInfo answer is cached briefly: when no webhook is set there is nothing new to learn
+WEBHOOK_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "kingspeech", "webhook.json")
+WEBHOOK_CACHE_TTL = 60
+
+def _read_webhook_cache():
+    """Return cached getWebhookInfo result if fresh and no webhook was set, else None"""
+    try:
+        if time.time() - os.path.getmtime(WEBHOOK_CACHE_FILE) >= WEBHOOK_CACHE_TTL:
+            return None
+        with open(WEBHOOK_CACHE_FILE, "rb") as f:
+            result = orjson.loads(f.read())["result"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return None if result.get("url") else result
+
+def _write_webhook_cache(content):
+    """Store the raw getWebhookInfo response body"""
+    try:
+        os.makedirs(os.path.dirname(WEBHOOK_CACHE_FILE), exist_ok=True)
+        with open(WEBHOOK_CACHE_FILE, "wb") as f:
+            f.write(content)
+    except OSError:
+        pass
+
+def invalidate_webhook_cache():
+    """Drop the cached webhook info; call after setWebhook/deleteWebhook"""
+    try:
+        os.remove(WEBHOOK_CACHE_FILE)
+    except OSError:
+        pass
+
+def _write_lines(lines):
+    """Write a report block with a single stdout call"""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+async def check_bot(client: httpx.AsyncClient):
     """Check bot via Telegram API"""
-    print("Checking bot via Telegram API...")
+    lines = ["Checking bot via Telegram API..."]
     
     # Test getMe endpoint
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getMe"
+    url = GET_ME
     
     try:
-        response = requests.get(url, timeout=10)
-        print(f"Status code: {response.status_code}")
+        response = await client.get(url)
+        lines.append(f"Status code: {response.status_code}")
         
         if response.status_code == 200:
-            data = response.json()
-            print("Bot info:")
-            print(f"  ID: {data['result']['id']}")
-            print(f"  Name: {data['result']['first_name']}")
-            print(f"  Username: {data['result']['username']}")
-            print(f"  Can join groups: {data['result']['can_join_groups']}")
-            print(f"  Can read all group messages: {data['result']['can_read_all_group_messages']}")
-            print(f"  Supports inline queries: {data['result']['supports_inline_queries']}")
-            print("✅ Bot is valid and active!")
+            data = orjson.loads(response.content)
+            lines.append("Bot info:")
+            lines.append(f"  ID: {data['result']['id']}")
+            lines.append(f"  Name: {data['result']['first_name']}")
+            lines.append(f"  Username: {data['result']['username']}")
+            lines.append(f"  Can join groups: {data['result']['can_join_groups']}")
+            lines.append(f"  Can read all group messages: {data['result']['can_read_all_group_messages']}")
+            lines.append(f"  Supports inline queries: {data['result']['supports_inline_queries']}")
+            lines.append("✅ Bot is valid and active!")
             return True
         else:
-            print(f"❌ Error: {response.text}")
+            lines.append(f"❌ Error: {response.text}")
             return False
             
     except Exception as e:
-        print(f"❌ Error checking bot: {e}")
+        lines.append(f"❌ Error checking bot: {e}")
         return False
+    finally:
+        _write_lines(lines)
 
-def test_webhook():
+async def test_webhook(client: httpx.AsyncClient):
     """Test webhook info"""
-    print("\nChecking webhook info...")
+    lines = ["\nChecking webhook info..."]
     
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getWebhookInfo"
+    url = GET_WEBHOOK_INFO
     
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            print(f"Webhook URL: {data['result']['url']}")
-            print(f"Has custom certificate: {data['result']['has_custom_certificate']}")
-            print(f"Pending update count: {data['result']['pending_update_count']}")
-            print(f"Last error date: {data['result']['last_error_date']}")
-            print(f"Last error message: {data['result']['last_error_message']}")
+        result = _read_webhook_cache()
+        if result is None:
+            response = await client.get(url)
+            if response.status_code != 200:
+                return
+            result = orjson.loads(response.content)['result']
+            _write_webhook_cache(response.content)
+        else:
+            lines.append(f"Using cached webhook info (< {WEBHOOK_CACHE_TTL}s old)")
+        
+        lines.append(f"Webhook URL: {result['url']}")
+        lines.append(f"Has custom certificate: {result['has_custom_certificate']}")
+        lines.append(f"Pending update count: {result['pending_update_count']}")
+        lines.append(f"Last error date: {result['last_error_date']}")
+        lines.append(f"Last error message: {result['last_error_message']}")
+        
+        if result['url']:
+            lines.append("⚠️  Webhook is set - this might interfere with polling")
+        else:
+            lines.append("✅ No webhook set - polling should work")
             
-            if data['result']['url']:
-                print("⚠️  Webhook is set - this might interfere with polling")
-            else:
-                print("✅ No webhook set - polling should work")
-                
     except Exception as e:
-        print(f"❌ Error checking webhook: {e}")
+        lines.append(f"❌ Error checking webhook: {e}")
+    finally:
+        _write_lines(lines)
+
+async def main():
+    """Run both checks concurrently over a shared client"""
+    async with httpx.AsyncClient(http2=_HTTP2, timeout=10) as client:
+        await asyncio.gather(check_bot(client), test_webhook(client))
 
 if __name__ == "__main__":
-    check_bot()
-    test_webhook()
+    asyncio.run(main())
@@ -1,14 +1,15 @@
 from dataclasses import dataclass
-from typing import List, Optional, Callable, Dict, Any
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from functools import lru_cache
+from typing import List, Optional, Callable, Dict, Any, Tuple
+import json
 import logging
+import threading
+import time
 
-# Настройка логирования
-logging.basicConfig(level=logging.DEBUG)
+# Логирование настраивается в точке входа приложения
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True)
 class Step:
     message: str = ""
     next_step: Optional[Callable] = None
@@ -16,7 +17,7 @@ class Step:
     variables: Optional[List['Variable']] = None
     reply_markup: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class Variable:
     name: str
     value: Any = None
@@ -24,7 +25,7 @@ class Variable:
 class Context:
     def __init__(self, telegram=None):
         self.telegram = telegram
-        self._variables = {}
+        self._variables: Dict[str, Any] = {}
         self._user_message = ""
 
     def set_variable(self, name: str, value: Any):
@@ -33,12 +34,24 @@ class Context:
     def get_variable(self, name: str, default=None):
         return self._variables.get(name, default)
 
+    def get_variables(self) -> Dict[str, Any]:
+        """Снимок всех переменных одним вызовом"""
+        return dict(self._variables)
+
     def set_user_message(self, message: str):
         self._user_message = message
 
     def get_user_message(self) -> str:
         return self._user_message
 
+    def clear(self) -> "Context":
+        """Сбрасывает состояние, чтобы объект можно было переиспользовать"""
+        self._variables.clear()
+        self._user_message = ""
+        self.telegram = None
+        self.contact = None
+        return self
+
 class Dialog:
     def __init__(self):
         self.steps = {}
@@ -49,70 +62,171 @@ class Dialog:
             return func
         return decorator
 
+def _to_a1(col: int) -> str:
+    """Номер колонки (1-индексация) в буквенную нотацию A1: 1 -> A, 27 -> AA"""
+    name = ''
+    while col > 0:
+        col, rem = divmod(col - 1, 26)
+        name = chr(65 + rem) + name
+    return name
+
+# Таблица имён колонок A..ZZ, индекс 0 не используется
+_COL_NAMES = [''] + [_to_a1(i) for i in range(1, 703)]
+
+# Таймаут HTTP-запросов к Sheets API, секунды
+SHEETS_HTTP_TIMEOUT = 15
+
+@lru_cache(maxsize=1)
+def _get_credentials(google_credentials: Optional[str], scopes: Tuple[str, ...]):
+    """Создаёт credentials сервисного аккаунта один раз на процесс"""
+    # Google SDK тяжёлый — импортируем только при создании клиента,
+    # чтобы Step/Context/Dialog импортировались без него
+    from google.oauth2 import service_account
+
+    if google_credentials:
+        # Парсим JSON из переменной окружения
+        creds_info = json.loads(google_credentials)
+        creds = service_account.Credentials.from_service_account_info(
+            creds_info,
+            scopes=scopes
+        )
+        logger.debug("Successfully created credentials from environment variable")
+    else:
+        # Fallback к файлу (для локальной разработки)
+        creds = service_account.Credentials.from_service_account_file(
+            'service-account.json',
+            scopes=scopes
+        )
+        logger.debug("Successfully created credentials from service account file")
+    return creds
+
+@lru_cache(maxsize=1)
+def _build_service(google_credentials: Optional[str], scopes: Tuple[str, ...]):
+    """Строит клиент Sheets API один раз: все экземпляры GoogleSheets делят его"""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+    from googleapiclient.http import HttpRequest
+
+    creds = _get_credentials(google_credentials, scopes)
+    local = threading.local()
+
+    def thread_http():
+        # httplib2.Http не потокобезопасен, а Sheets вызывается из пулов потоков и таймера:
+        # у каждого потока свой авторизованный клиент, соединение переиспользуется внутри потока
+        http = getattr(local, 'http', None)
+        if http is None:
+            http = local.http = AuthorizedHttp(creds, http=httplib2.Http(timeout=SHEETS_HTTP_TIMEOUT))
+        return http
+
+    def build_request(_http, *args, **kwargs):
+        return HttpRequest(thread_http(), *args, **kwargs)
+
+    # Discovery-документ берётся из встроенного в googleapiclient; файловый кэш не нужен
+    return build('sheets', 'v4', http=thread_http(), requestBuilder=build_request, cache_discovery=False)
+
 class GoogleSheets:
     SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
     def __init__(self, spreadsheet_id: str, sheet_name: str):
         self.spreadsheet_id = spreadsheet_id
-        self.sheet_name = sheet_name
-        logger.debug(f"Initializing GoogleSheets with spreadsheet_id: {spreadsheet_id}, sheet_name: {sheet_name}")
+        self.sheet_name = sheet_name  # заодно вычисляет _sheet_prefix
+        logger.debug("Initializing GoogleSheets with spreadsheet_id: %s, sheet_name: %s", spreadsheet_id, sheet_name)
         self.service = self._get_service()
+        # Кэш строк листа: (время чтения, имя листа, строки)
+        self._rows_cache: Optional[Tuple[float, str, list]] = None
+        # Индекс telegram_id -> номера строк (1-индексация), строится лениво
+        self._row_index: Optional[Dict[str, List[int]]] = None
+        # Отложенные записи: строки для append (по листам) и обновления статусов
+        self._pending: Dict[str, List[list]] = {}
+        self._pending_updates: List[Dict[str, Any]] = []
+        # Один реентерабельный лок на буферы и кэши: экземпляр вызывается из пулов потоков
+        self._pending_lock = threading.RLock()
+
+    FLUSH_MAX_PENDING = 10
+
+    @property
+    def sheet_name(self) -> str:
+        return self._sheet_name
+
+    @sheet_name.setter
+    def sheet_name(self, value: str):
+        # Префикс диапазона пересобираем только при смене листа
+        self._sheet_name = value
+        self._sheet_prefix = f'{value}!'
 
     def _get_service(self):
         try:
             import os
-            import json
-            
             # Пытаемся получить credentials из переменной окружения
-            google_credentials = os.getenv('GOOGLE_CREDENTIALS')
-            
-            if google_credentials:
-                # Парсим JSON из переменной окружения
-                creds_info = json.loads(google_credentials)
-                creds = service_account.Credentials.from_service_account_info(
-                    creds_info,
-                    scopes=self.SCOPES
-                )
-                logger.debug("Successfully created credentials from environment variable")
-            else:
-                # Fallback к файлу (для локальной разработки)
-                creds = service_account.Credentials.from_service_account_file(
-                    'service-account.json',
-                    scopes=self.SCOPES
-                )
-                logger.debug("Successfully created credentials from service account file")
-            
-            return build('sheets', 'v4', credentials=creds)
+            return _build_service(os.getenv('GOOGLE_CREDENTIALS'), tuple(self.SCOPES))
         except Exception as e:
-            logger.error(f"Error in _get_service: {str(e)}", exc_info=True)
+            logger.error("Error in _get_service: %s", e, exc_info=True)
             raise
 
-    def append_row(self, data):
+    def append_row(self, data, flush: bool = True):
+        """Добавляет строку; при flush=False строка копится до flush() (или FLUSH_MAX_PENDING записей)"""
         try:
             # Если data — это список, используем его напрямую
             if isinstance(data, list):
                 values = data
-            # Если data — это словарь, преобразуем в список значений
+            # Если data — это словарь, берём значения в порядке ключей
             elif isinstance(data, dict):
-                values = [data.get(key, "") for key in data.keys()]
+                values = list(data.values())
             else:
                 raise ValueError("append_row: data must be list or dict")
-            body = {
-                'values': [values]
-            }
-            range_name = f'{self.sheet_name}!A:Z'
-            logger.debug(f"Appending row to range: {range_name}")
-            self.service.spreadsheets().values().append(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name,
-                valueInputOption='USER_ENTERED',
-                body=body
-            ).execute()
-            logger.debug("Successfully appended row to spreadsheet")
+            with self._pending_lock:
+                self._pending.setdefault(self.sheet_name, []).append(values)
+            if flush or self._pending_count() >= self.FLUSH_MAX_PENDING:
+                self.flush()
         except Exception as e:
-            logger.error(f"Error in append_row: {str(e)}", exc_info=True)
+            logger.error("Error in append_row: %s", e, exc_info=True)
             raise
 
+    def _pending_count(self) -> int:
+        with self._pending_lock:
+            return sum(len(rows) for rows in self._pending.values()) + len(self._pending_updates)
+
+    def flush(self):
+        """Отправляет накопленные строки и обновления статусов минимальным числом запросов.
+
+        При ошибке неотправленное отбрасывается (с записью в лог) и исключение пробрасывается:
+        повтор append мог бы задвоить строку, если запрос на самом деле дошёл до таблицы.
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            pending_updates, self._pending_updates = self._pending_updates, []
+        if not pending and not pending_updates:
+            return
+        try:
+            # Все строки одного листа уходят одним append-запросом
+            for sheet_name, rows in list(pending.items()):
+                range_name = f'{sheet_name}!A:Z'
+                logger.debug("Appending %d row(s) to range: %s", len(rows), range_name)
+                self.service.spreadsheets().values().append(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=range_name,
+                    valueInputOption='USER_ENTERED',
+                    body={'values': rows}
+                ).execute()
+                del pending[sheet_name]
+            if pending_updates:
+                self.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={'valueInputOption': 'USER_ENTERED', 'data': pending_updates}
+                ).execute()
+                pending_updates = []
+            logger.debug("Successfully flushed pending writes to spreadsheet")
+        except Exception as e:
+            logger.error("Error in flush: %s", e, exc_info=True)
+            for sheet_name, rows in pending.items():
+                logger.error("Dropped %d unsent row(s) for sheet %s: %s", len(rows), sheet_name, rows)
+            if pending_updates:
+                logger.error("Dropped %d unsent status update(s): %s", len(pending_updates), pending_updates)
+            raise
+        finally:
+            self._invalidate_rows_cache()
+
     def get_or_create_sheet(self, sheet_name):
         # Получаем список листов
         sheets_metadata = self.service.spreadsheets().get(spreadsheetId=self.spreadsheet_id).execute()
@@ -131,41 +245,95 @@ class GoogleSheets:
             ).execute()
         self.sheet_name = sheet_name
 
-    def update_status(self, telegram_id, reg_time, new_status):
-        # Получаем все строки листа
-        range_name = f'{self.sheet_name}!A:Z'
-        result = self.service.spreadsheets().values().get(
-            spreadsheetId=self.spreadsheet_id,
-            range=range_name
-        ).execute()
-        values = result.get('values', [])
+    def _invalidate_rows_cache(self):
+        with self._pending_lock:
+            self._rows_cache = None
+            self._row_index = None
+
+    def _get_values(self, ttl: float = 2.0) -> list:
+        """Возвращает строки текущего листа, кэшируя их на ttl секунд"""
+        with self._pending_lock:
+            if self._pending or self._pending_updates:
+                try:
+                    self.flush()
+                except Exception:
+                    # Ошибка записи уже залогирована в flush и не мешает чтению
+                    pass
+            cached = self._rows_cache
+            if cached and cached[1] == self.sheet_name and time.monotonic() - cached[0] < ttl:
+                return cached[2]
+            range_name = self._sheet_prefix + 'A:Z'
+            # Колонки не сужаем: reg_time не имеет фиксированной колонки, а статус — последняя
+            # заполненная ячейка строки. Убираем хотя бы метаданные ответа (range, majorDimension).
+            result = self.service.spreadsheets().values().get(
+                spreadsheetId=self.spreadsheet_id,
+                range=range_name,
+                fields='values'
+            ).execute()
+            values = result.get('values', [])
+            self._rows_cache = (time.monotonic(), self.sheet_name, values)
+            self._row_index = None
+            return values
+
+    def _find_row(self, telegram_id, reg_time, ttl: float = 2.0) -> Optional[Tuple[int, list]]:
+        """Ищет строку по telegram_id и времени (reg_time), возвращает (1-индексированный номер, строка)"""
+        with self._pending_lock:
+            values = self._get_values(ttl)
+            if self._row_index is None:
+                index: Dict[str, List[int]] = {}
+                for idx, row in enumerate(values):
+                    if len(row) >= 2:
+                        index.setdefault(row[0], []).append(idx + 1)
+                self._row_index = index
+            # Строки пользователя проверяются по порядку листа: первая подходящая, как и при полном скане
+            for row_number in self._row_index.get(str(telegram_id), ()):
+                row = values[row_number - 1]
+                # reg_time не имеет фиксированной колонки — проверяем ячейки, не строя repr всей строки
+                if any(reg_time in cell for cell in row[1:]):
+                    return row_number, row
+            return None
+
+    def update_status(self, telegram_id, reg_time, new_status, flush: bool = True):
         # Ищем строку по telegram_id и времени (reg_time)
-        target_row = None
-        for idx, row in enumerate(values):
-            if len(row) >= 2 and str(row[0]) == str(telegram_id) and reg_time in str(row):
-                target_row = idx + 1  # 1-индексация в Google Sheets
-                break
-        if not target_row:
+        found = self._find_row(telegram_id, reg_time)
+        if not found:
             raise Exception('Заявка не найдена в таблице')
+        target_row, row = found
         # Обновляем последний столбец (статус)
-        col = len(values[target_row-1])
-        status_range = f'{self.sheet_name}!{chr(65+col-1)}{target_row}'
-        self.service.spreadsheets().values().update(
-            spreadsheetId=self.spreadsheet_id,
-            range=status_range,
-            valueInputOption='USER_ENTERED',
-            body={'values': [[new_status]]}
-        ).execute()
+        col = len(row)
+        status_range = self._sheet_prefix + _COL_NAMES[col] + str(target_row)
+        with self._pending_lock:
+            self._pending_updates.append({'range': status_range, 'values': [[new_status]]})
+        if flush or self._pending_count() >= self.FLUSH_MAX_PENDING:
+            self.flush()
+
+    def update_statuses(self, updates: List[Tuple[Any, str, str]]) -> List[Tuple[Any, str, str]]:
+        """Обновляет статусы пачкой: все строки ищутся по одному чтению листа, запись — одним batchUpdate.
+        Возвращает обновления, для которых заявка не найдена"""
+        data, missing = [], []
+        with self._pending_lock:
+            self._get_values()
+            for telegram_id, reg_time, new_status in updates:
+                # Лист уже прочитан выше — берём строки из кэша, даже если чтение было долгим
+                found = self._find_row(telegram_id, reg_time, ttl=float('inf'))
+                if not found:
+                    missing.append((telegram_id, reg_time, new_status))
+                    continue
+                target_row, row = found
+                status_range = self._sheet_prefix + _COL_NAMES[len(row)] + str(target_row)
+                data.append({'range': status_range, 'values': [[new_status]]})
+        if data:
+            try:
+                self.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={'valueInputOption': 'USER_ENTERED', 'data': data}
+                ).execute()
+            finally:
+                self._invalidate_rows_cache()
+        return missing
 
     def get_status(self, telegram_id, reg_time):
-        range_name = f'{self.sheet_name}!A:Z'
-        result = self.service.spreadsheets().values().get(
-            spreadsheetId=self.spreadsheet_id,
-            range=range_name
-        ).execute()
-        values = result.get('values', [])
-        for row in values:
-            if len(row) >= 2 and str(row[0]) == str(telegram_id) and reg_time in str(row):
-                if len(row) > 0:
-                    return row[-1]  # Статус — последний столбец
-        return None 
\ No newline at end of file
+        found = self._find_row(telegram_id, reg_time)
+        if found:
+            return found[1][-1]  # Статус — последний столбец
+        return None
@@ -4,49 +4,98 @@ Debug bot with detailed logging
 """
 
 import logging
-import sys
+import logging.handlers
 import os
+import queue
+import sys
 
-# Add current directory to path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-from telegram.ext import Application, CommandHandler
+from telegram import Update
+from telegram.ext import Application, CommandHandler, TypeHandler
 from config import TELEGRAM_BOT_TOKEN
 
-# Enable debug logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
+logger = logging.getLogger(__name__)
+
+def setup_logging():
+    """Enable debug logging; records are written by a background QueueListener thread"""
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, console)
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    return listener
+
+# Last processed update_id survives restarts so pending updates are processed, not dropped
+LAST_UPDATE_ID_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.last_update_id')
+last_update_id = None
+
+def load_last_update_id():
+    """Read the persisted update_id, if any"""
+    try:
+        with open(LAST_UPDATE_ID_FILE) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+async def track_update_id(update, context):
+    """Remember the newest update_id seen (runs before the command handlers)"""
+    global last_update_id
+    if last_update_id is None or update.update_id > last_update_id:
+        last_update_id = update.update_id
+
+async def post_init(app):
+    """Confirm already-processed updates so Telegram forgets them server-side"""
+    persisted = load_last_update_id()
+    if persisted is not None:
+        await app.bot.get_updates(offset=persisted + 1, timeout=0, limit=1)
+        logger.debug("Confirmed updates up to %s", persisted)
+
+async def post_stop(app):
+    """Persist the last processed update_id"""
+    if last_update_id is not None:
+        with open(LAST_UPDATE_ID_FILE, 'w') as f:
+            f.write(str(last_update_id))
 
 def start_command(update, context):
     """Start command handler"""
-    print(f"Received /start from user {update.effective_user.id}")
-    print(f"User: {update.effective_user.first_name} {update.effective_user.last_name}")
-    print(f"Username: {update.effective_user.username}")
+    user = update.effective_user
+    logger.debug("Received /start from user %s", user.id)
+    logger.debug("User: %s %s", user.first_name, user.last_name)
+    logger.debug("Username: %s", user.username)
     
     try:
         update.message.reply_text("Привет! Бот KingSpeech работает! 🎉")
-        print("Reply sent successfully")
+        logger.debug("Reply sent successfully")
     except Exception as e:
-        print(f"Error sending reply: {e}")
+        logger.error("Error sending reply: %s", e)
 
 def help_command(update, context):
     """Help command handler"""
-    print(f"Received /help from user {update.effective_user.id}")
+    logger.debug("Received /help from user %s", update.effective_user.id)
     update.message.reply_text("Это тестовый бот KingSpeech. Используйте /start для начала.")
 
 def main():
     """Main function"""
+    listener = setup_logging()
     print("Starting Debug KingSpeech Bot...")
     print(f"Token: {TELEGRAM_BOT_TOKEN[:10]}...")
     
     try:
         # Create application
-        app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        app = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .connect_timeout(10)
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .build()
+        )
         print("Application created successfully")
         
         # Add handlers
+        app.add_handler(TypeHandler(Update, track_update_id), group=-1)
         app.add_handler(CommandHandler("start", start_command))
         app.add_handler(CommandHandler("help", help_command))
         print("Handlers registered successfully")
@@ -54,13 +103,16 @@ def main():
         print("Bot is starting...")
         print("Send /start to your bot to test it!")
         
-        # Start polling
-        app.run_polling(drop_pending_updates=True)
+        # Start long polling
+        app.run_polling(timeout=30, poll_interval=0.0)
         
     except Exception as e:
         print(f"Error in main: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        # Flush queued log records before exit
+        listener.stop()
 
 if __name__ == "__main__":
     try:
@@ -9,17 +9,19 @@ from services.dialog_manager import dialog_manager, DialogBranch
 
 logger = logging.getLogger(__name__)
 
-def load_all_dialogs():
-    """Load and register all dialog branches"""
+def load_all_dialogs() -> List[str]:
+    """Load and register all dialog branches (called once by the bot entry point)"""
+    if getattr(load_all_dialogs, "_done", False):
+        return list(dialog_manager.branches.keys())
+    
     try:
         # Import all dialog modules to register them
         from . import main_survey
         
+        load_all_dialogs._done = True
         logger.info("All dialog branches loaded successfully")
         logger.info(f"Available branches: {list(dialog_manager.branches.keys())}")
+        return list(dialog_manager.branches.keys())
     except Exception as e:
         logger.error(f"Error loading dialog branches: {e}")
         raise
-
-# Load all dialogs when module is imported
-_loaded_branches = load_all_dialogs()
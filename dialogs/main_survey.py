@@ -4,7 +4,11 @@ Modular implementation of the main survey flow
 """
 
 import logging
-from typing import Optional, List
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Dict, Optional, List, Tuple
 from cursor import Context, Step
 from services.dialog_base import BaseDialog
 from services.localization_service import localization
@@ -15,6 +19,134 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMa
 
 logger = logging.getLogger(__name__)
 
+# Варианты ответов по языкам: строятся один раз при импорте, а не на каждый шаг
+_LEVEL_OPTS = {
+    'ru': ("С нуля 🆕", "Начинающий (A1–A2) 🟢", "Средний (B1–B2) 🟡", "Продвинутый (C1–C2) 🟣", "Не уверен(а) ❓"),
+    'en': ("Beginner 🆕", "Elementary (A1–A2) 🟢", "Intermediate (B1–B2) 🟡", "Advanced (C1–C2) 🟣", "Not sure ❓"),
+}
+_GOAL_OPTS = {
+    'ru': ("Общий язык 🌐", "Разговорный 🗣️", "Для путешествий ✈️", "Бизнес-язык 💼",
+           "Подготовка к экзаменам 🎓", "Для детей 👶", "Другое 📝"),
+    'en': ("General language 🌐", "Conversational 🗣️", "For travel ✈️", "Business language 💼",
+           "Exam preparation 🎓", "For children 👶", "Other 📝"),
+}
+_FORMAT_OPTS = {
+    'ru': ("Индивидуальный", "Парный", "Группа (от 3х человек)", "Онлайн"),
+    'en': ("Individual", "Pair", "Group (3+ people)", "Online"),
+}
+_EXP_OPTS = {
+    'ru': ("Разнообразие слов и выражений 📝", "Преодоление плато 🧗", "Интересные задания 🎲",
+           "Обратную связь 💬", "Лёгкость в общении 💡", "Другое 📝"),
+    'en': ("Variety of words and expressions 📝", "Overcoming plateau 🧗", "Interesting tasks 🎲",
+           "Feedback 💬", "Ease in communication 💡", "Other 📝"),
+}
+_START_DATE_OPTS = {
+    'ru': ("Прямо сейчас 🚀", "На следующей неделе 📅", "Через пару недель ⏳", "Ещё не решил(а) 🤔"),
+    'en': ("Right now 🚀", "Next week 📅", "In a couple of weeks ⏳", "Haven't decided yet 🤔"),
+}
+
+# Множества для O(1) проверки выбранного ожидания (принимаются оба языка)
+_EXP_SET_RU = frozenset(_EXP_OPTS['ru'])
+_EXP_SET_EN = frozenset(_EXP_OPTS['en'])
+_EXP_SET = _EXP_SET_RU | _EXP_SET_EN
+# Канонический порядок ожиданий для итоговой строки (позиция в списке вариантов)
+_EXP_ORDER = {exp: i for opts in _EXP_OPTS.values() for i, exp in enumerate(opts)}
+
+# Клавиатура ожиданий зависит только от языка и отмеченных вариантов (6 бит),
+# поэтому готовые InlineKeyboardMarkup переиспользуются (не более 2·64 штук)
+_EXP_KB_CACHE: Dict[Tuple[str, int], InlineKeyboardMarkup] = {}
+
+def _get_exp_kb(lang: str, selected: set) -> InlineKeyboardMarkup:
+    """Клавиатура мультивыбора ожиданий с отметками для выбранных вариантов"""
+    options = _opts(_EXP_OPTS, lang)
+    mask = 0
+    for bit, exp in enumerate(options):
+        if exp in selected:
+            mask |= 1 << bit
+    reply_markup = _EXP_KB_CACHE.get((lang, mask))
+    if reply_markup is None:
+        keyboard = []
+        for bit, exp in enumerate(options):
+            mark = "✅" if mask & (1 << bit) else "❌"
+            keyboard.append([InlineKeyboardButton(f"{mark} {exp}", callback_data=exp)])
+        done_btn = _t('done', lang)
+        keyboard.append([InlineKeyboardButton(done_btn, callback_data=done_btn)])
+        reply_markup = _EXP_KB_CACHE[(lang, mask)] = InlineKeyboardMarkup(keyboard)
+    return reply_markup
+
+@lru_cache(maxsize=8)
+def _phone_kb(lang: str) -> ReplyKeyboardMarkup:
+    """Клавиатура с кнопкой отправки контакта (одна на язык)"""
+    send_phone_btn = _t('send_phone', lang)
+    keyboard = [[KeyboardButton(send_phone_btn, request_contact=True)]]
+    return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+
+# Запись в Google Sheets и отправка лида идут в фоне, чтобы не блокировать обработку обновлений.
+# Один поток: операции над общим экземпляром GoogleSheets выполняются по очереди
+_IO_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="survey-io")
+
+SAVE_ERROR_MESSAGE = "Произошла ошибка при сохранении данных. Пожалуйста, начните сначала с команды /start"
+# Строка не записалась в таблицу, но лид дошёл до менеджеров — повторный опрос дал бы дубль
+SAVE_ERROR_LEAD_SENT_MESSAGE = "Не удалось сохранить ваши ответы в таблицу, но заявка уже передана менеджеру — проходить опрос заново не нужно."
+
+def _log_io_error(future: Future) -> None:
+    """Логирует ошибку фоновой операции (иначе она потерялась бы в Future)"""
+    exc = future.exception()
+    if exc is not None:
+        logger.error(f"Background survey I/O failed: {exc}", exc_info=exc)
+
+def _submit_io(func, *args) -> Future:
+    """Запускает блокирующую операцию в _IO_POOL с логированием ошибок"""
+    future = _IO_POOL.submit(func, *args)
+    future.add_done_callback(_log_io_error)
+    return future
+
+# Все варианты прогресс-бара опроса (7 шагов, длина 8) — индекс равен номеру шага
+_PROGRESS_BARS = tuple("■" * int(8 * i / 7) + "□" * (8 - int(8 * i / 7)) for i in range(8))
+
+@dataclass(frozen=True)
+class SurveyStep:
+    """Описание шага опроса с одиночным выбором"""
+    idx: int            # номер шага для прогресс-бара
+    prompt_key: str     # ключ локализации вопроса
+    options: dict       # варианты ответа по языкам
+    storage_key: str    # куда сохраняется выбор
+    next: str           # следующий шаг: имя из _STEPS или суффикс метода _<next>_step
+
+_STEPS = {
+    'level': SurveyStep(2, 'ask_level', _LEVEL_OPTS, 'level', 'goal'),
+    'goal': SurveyStep(3, 'ask_goal', _GOAL_OPTS, 'goals', 'format'),
+    'format': SurveyStep(4, 'ask_format', _FORMAT_OPTS, 'format', 'expectations'),
+    'start_date': SurveyStep(6, 'ask_start_date', _START_DATE_OPTS, 'start_date', 'phone'),
+}
+
+def _opts(table: dict, lang: str) -> tuple:
+    """Варианты для языка интерфейса; всё, кроме английского, показывается по-русски"""
+    return table['en'] if lang == 'en' else table['ru']
+
+@lru_cache(maxsize=512)
+def _t(key: str, lang: str) -> str:
+    """Кэшированный перевод для ключей без параметров"""
+    return localization.t(key, lang)
+
+# Номер шага (для прогресс-бара) для каждого вопроса опроса
+_PROMPT_STEPS = {
+    'ask_name': 1, 'ask_level': 2, 'ask_goal': 3, 'ask_format': 4,
+    'ask_expectations': 5, 'ask_start_date': 6, 'ask_phone': 7,
+}
+# Готовые тексты вопросов с прогресс-баром для основных языков
+_PROMPTS = {
+    (key, lang): f"{_PROGRESS_BARS[idx]}\n{localization.t(key, lang)}"
+    for lang in ('ru', 'en') for key, idx in _PROMPT_STEPS.items()
+}
+
+def _prompt(key: str, lang: str) -> str:
+    """Текст вопроса с прогресс-баром; для прочих языков собирается и запоминается при первом обращении"""
+    message = _PROMPTS.get((key, lang))
+    if message is None:
+        message = _PROMPTS[(key, lang)] = f"{_PROGRESS_BARS[_PROMPT_STEPS[key]]}\n{_t(key, lang)}"
+    return message
+
 class MainSurveyDialog(BaseDialog):
     """Main survey dialog branch"""
     
@@ -25,6 +157,14 @@ class MainSurveyDialog(BaseDialog):
             tags=["survey", "course_matching", "lead_generation"],
             priority=100  # High priority - main flow
         )
+        # next_step-колбэки для табличных шагов создаются один раз
+        self._processors = {name: partial(self._process, name) for name in _STEPS}
+        # Таблица переходов: шаг -> функция, рисующая следующий шаг (разрешается один раз)
+        self._transitions = {
+            name: partial(self._render, name=spec.next) if spec.next in _STEPS
+            else getattr(self, f"_{spec.next}_step")
+            for name, spec in _STEPS.items()
+        }
     
     def entry_point(self, context: Context) -> Step:
         """Entry point for main survey"""
@@ -36,6 +176,9 @@ class MainSurveyDialog(BaseDialog):
                 # This should be handled by the main bot, not here
                 return self.create_step("Пожалуйста, выберите язык интерфейса.", next_step=None)
             
+            # Ожидания хранятся списком до нажатия "Готово"
+            self.set_user_data(context, "expectations", [])
+            
             # Language already selected, go directly to greeting
             return self._greeting_step(context)
             
@@ -47,8 +190,8 @@ class MainSurveyDialog(BaseDialog):
     def _greeting_step(self, context: Context) -> Step:
         """Greeting step"""
         lang = self.get_user_data(context, 'interface_lang', 'ru')
-        message = localization.t('start_greeting', lang)
-        start_btn = localization.t('start_button', lang)
+        message = _t('start_greeting', lang)
+        start_btn = _t('start_button', lang)
         options = [start_btn]
         return self.create_step(message, next_step=self._process_greeting, options=options)
     
@@ -61,8 +204,7 @@ class MainSurveyDialog(BaseDialog):
     def _name_step(self, context: Context) -> Step:
         """Name input step"""
         lang = self.get_user_data(context, 'interface_lang', 'ru')
-        progress = self._get_progress_bar(1, 7)
-        message = f"{progress}\n{localization.t('ask_name', lang)}"
+        message = _prompt('ask_name', lang)
         return self.create_step(message, next_step=self._process_name)
     
     def _process_name(self, context: Context, choice: str = None) -> Step:
@@ -75,215 +217,75 @@ class MainSurveyDialog(BaseDialog):
         
         if not validation_result.is_valid:
             progress = self._get_progress_bar(1, 7)
-            message = f"{progress}\n{validation_result.error_message}\n\n{localization.t('ask_name', lang)}"
+            message = f"{progress}\n{validation_result.error_message}\n\n{_t('ask_name', lang)}"
             return self.create_step(message, next_step=self._process_name)
         
         # Save validated and sanitized user data
         self.set_user_data(context, 'user_name', validation_result.sanitized_value)
         
         # Save Telegram data
-        try:
-            telegram_id = context.telegram.id
-            telegram_username = context.telegram.username or "Не указан"
-            self.set_user_data(context, "telegram_id", telegram_id)
-            self.set_user_data(context, "telegram_username", telegram_username)
-        except Exception as e:
-            logger.warning(f"Failed to get Telegram data: {e}")
-        
-        return self._level_step(context)
-    
-    def _level_step(self, context: Context) -> Step:
-        """Level selection step"""
-        lang = self.get_user_data(context, 'interface_lang', 'ru')
-        progress = self._get_progress_bar(2, 7)
-        
-        level_options = [
-            ("С нуля 🆕", "Beginner 🆕"), ("Начинающий (A1–A2) 🟢", "Elementary (A1–A2) 🟢"),
-            ("Средний (B1–B2) 🟡", "Intermediate (B1–B2) 🟡"), ("Продвинутый (C1–C2) 🟣", "Advanced (C1–C2) 🟣"),
-            ("Не уверен(а) ❓", "Not sure ❓")
-        ]
-        
-        if lang == 'en':
-            message = f"{progress}\n{localization.t('ask_level', lang)}"
-            options = [en for ru, en in level_options]
+        tg = getattr(context, 'telegram', None)
+        if tg is not None:
+            self.set_user_data(context, "telegram_id", tg.id)
+            self.set_user_data(context, "telegram_username", tg.username or "Не указан")
         else:
-            message = f"{progress}\n{localization.t('ask_level', lang)}"
-            options = [ru for ru, en in level_options]
+            logger.warning("Failed to get Telegram data: context has no telegram user")
         
-        return self.create_step(message, next_step=self._process_level, options=options)
+        return self._render(context, 'level')
     
-    def _process_level(self, context: Context, choice: str = None) -> Step:
-        """Process level selection"""
-        if not choice:
-            return self._level_step(context)
-        
-        self.set_user_data(context, "level", choice)
-        return self._goal_step(context)
-    
-    def _goal_step(self, context: Context) -> Step:
-        """Goal selection step"""
+    def _render(self, context: Context, name: str) -> Step:
+        """Render a single-choice survey step described in _STEPS"""
+        spec = _STEPS[name]
         lang = self.get_user_data(context, 'interface_lang', 'ru')
-        progress = self._get_progress_bar(3, 7)
-        
-        goals_options = [
-            ("Общий язык 🌐", "General language 🌐"), ("Разговорный 🗣️", "Conversational 🗣️"),
-            ("Для путешествий ✈️", "For travel ✈️"), ("Бизнес-язык 💼", "Business language 💼"),
-            ("Подготовка к экзаменам 🎓", "Exam preparation 🎓"), ("Для детей 👶", "For children 👶"),
-            ("Другое 📝", "Other 📝")
-        ]
-        
-        if lang == 'en':
-            message = f"{progress}\n{localization.t('ask_goal', lang)}"
-            options = [en for ru, en in goals_options]
-        else:
-            message = f"{progress}\n{localization.t('ask_goal', lang)}"
-            options = [ru for ru, en in goals_options]
-        
-        return self.create_step(message, next_step=self._process_goal, options=options)
+        message = _prompt(spec.prompt_key, lang)
+        return self.create_step(message, next_step=self._processors[name], options=_opts(spec.options, lang))
     
-    def _process_goal(self, context: Context, choice: str = None) -> Step:
-        """Process goal selection"""
+    def _process(self, name: str, context: Context, choice: str = None) -> Step:
+        """Store the choice for a single-choice step and move to the next one"""
         if not choice:
-            return self._goal_step(context)
+            return self._render(context, name)
         
-        self.set_user_data(context, "goals", choice)
-        return self._format_step(context)
-    
-    def _format_step(self, context: Context) -> Step:
-        """Format selection step"""
-        lang = self.get_user_data(context, 'interface_lang', 'ru')
-        progress = self._get_progress_bar(4, 7)
-        
-        format_options = [
-            ("Индивидуальный", "Individual"), ("Парный", "Pair"), 
-            ("Группа (от 3х человек)", "Group (3+ people)"), ("Онлайн", "Online")
-        ]
-        
-        if lang == 'en':
-            message = f"{progress}\n{localization.t('ask_format', lang)}"
-            options = [en for ru, en in format_options]
-        else:
-            message = f"{progress}\n{localization.t('ask_format', lang)}"
-            options = [ru for ru, en in format_options]
-        
-        return self.create_step(message, next_step=self._process_format, options=options)
-    
-    def _process_format(self, context: Context, choice: str = None) -> Step:
-        """Process format selection"""
-        if not choice:
-            return self._format_step(context)
-        
-        self.set_user_data(context, "format", choice)
-        return self._expectations_step(context)
+        self.set_user_data(context, _STEPS[name].storage_key, choice)
+        return self._transitions[name](context)
     
     def _expectations_step(self, context: Context) -> Step:
         """Expectations selection step"""
         lang = self.get_user_data(context, 'interface_lang', 'ru')
-        progress = self._get_progress_bar(5, 7)
-        
-        expectations_options = [
-            ("Разнообразие слов и выражений 📝", "Variety of words and expressions 📝"),
-            ("Преодоление плато 🧗", "Overcoming plateau 🧗"),
-            ("Интересные задания 🎲", "Interesting tasks 🎲"),
-            ("Обратную связь 💬", "Feedback 💬"),
-            ("Лёгкость в общении 💡", "Ease in communication 💡"),
-            ("Другое 📝", "Other 📝")
-        ]
+        selected = set(self.get_user_data(context, "expectations") or ())
         
-        selected = self.get_user_data(context, "expectations", [])
-        if isinstance(selected, str):
-            selected = [selected]
+        reply_markup = _get_exp_kb(lang, selected)
         
-        keyboard = []
-        for ru, en in expectations_options:
-            exp = en if lang == 'en' else ru
-            mark = "✅" if exp in selected else "❌"
-            keyboard.append([InlineKeyboardButton(f"{mark} {exp}", callback_data=exp)])
-        
-        done_btn = localization.t('done', lang)
-        keyboard.append([InlineKeyboardButton(done_btn, callback_data=done_btn)])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        message = f"{progress}\n{localization.t('ask_expectations', lang)}"
+        message = _prompt('ask_expectations', lang)
         return self.create_step(message, next_step=self._process_expectations, reply_markup=reply_markup)
     
     def _process_expectations(self, context: Context, choice: str = None) -> Step:
         """Process expectations selection"""
         lang = self.get_user_data(context, 'interface_lang', 'ru')
-        expectations_options = [
-            ("Разнообразие слов и выражений 📝", "Variety of words and expressions 📝"),
-            ("Преодоление плато 🧗", "Overcoming plateau 🧗"),
-            ("Интересные задания 🎲", "Interesting tasks 🎲"),
-            ("Обратную связь 💬", "Feedback 💬"),
-            ("Лёгкость в общении 💡", "Ease in communication 💡"),
-            ("Другое 📝", "Other 📝")
-        ]
+        selected = set(self.get_user_data(context, "expectations") or ())
         
-        selected = self.get_user_data(context, "expectations", [])
-        if isinstance(selected, str):
-            selected = [selected]
-        
-        done_btn = localization.t('done', lang)
+        done_btn = _t('done', lang)
         
         if choice == done_btn:
-            self.set_user_data(context, "expectations", ", ".join(selected))
-            return self._start_date_step(context)
-        elif choice in [en for ru, en in expectations_options] + [ru for ru, en in expectations_options]:
-            if choice in selected:
-                selected.remove(choice)
-            else:
-                selected.append(choice)
+            ordered = sorted(selected, key=lambda exp: _EXP_ORDER.get(exp, len(_EXP_ORDER)))
+            self.set_user_data(context, "expectations", ", ".join(ordered))
+            return self._render(context, 'start_date')
+        elif choice in _EXP_SET:
+            # Переключаем отметку: добавляем, если не выбрано, иначе убираем
+            selected.symmetric_difference_update((choice,))
         
         # Update keyboard
-        keyboard = []
-        for ru, en in expectations_options:
-            exp = en if lang == 'en' else ru
-            mark = "✅" if exp in selected else "❌"
-            keyboard.append([InlineKeyboardButton(f"{mark} {exp}", callback_data=exp)])
-        keyboard.append([InlineKeyboardButton(done_btn, callback_data=done_btn)])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _get_exp_kb(lang, selected)
         
-        self.set_user_data(context, "expectations", selected)
-        progress = self._get_progress_bar(5, 7)
-        message = f"{progress}\n{localization.t('ask_expectations', lang)}"
+        self.set_user_data(context, "expectations", list(selected))
+        message = _prompt('ask_expectations', lang)
         return self.create_step(message, next_step=self._process_expectations, reply_markup=reply_markup)
     
-    def _start_date_step(self, context: Context) -> Step:
-        """Start date selection step"""
-        lang = self.get_user_data(context, 'interface_lang', 'ru')
-        progress = self._get_progress_bar(6, 7)
-        
-        start_date_options = [
-            ("Прямо сейчас 🚀", "Right now 🚀"), ("На следующей неделе 📅", "Next week 📅"),
-            ("Через пару недель ⏳", "In a couple of weeks ⏳"), ("Ещё не решил(а) 🤔", "Haven't decided yet 🤔")
-        ]
-        
-        if lang == 'en':
-            message = f"{progress}\n{localization.t('ask_start_date', lang)}"
-            options = [en for ru, en in start_date_options]
-        else:
-            message = f"{progress}\n{localization.t('ask_start_date', lang)}"
-            options = [ru for ru, en in start_date_options]
-        
-        return self.create_step(message, next_step=self._process_start_date, options=options)
-    
-    def _process_start_date(self, context: Context, choice: str = None) -> Step:
-        """Process start date selection"""
-        if not choice:
-            return self._start_date_step(context)
-        
-        self.set_user_data(context, "start_date", choice)
-        return self._phone_step(context)
-    
     def _phone_step(self, context: Context) -> Step:
         """Phone number collection step"""
         lang = self.get_user_data(context, 'interface_lang', 'ru')
-        progress = self._get_progress_bar(7, 7)
-        message = f"{progress}\n{localization.t('ask_phone', lang)}"
+        message = _prompt('ask_phone', lang)
         
-        send_phone_btn = localization.t('send_phone', lang)
-        keyboard = [[KeyboardButton(send_phone_btn, request_contact=True)]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+        reply_markup = _phone_kb(lang)
         
         return self.create_step(message, next_step=self._process_phone, reply_markup=reply_markup)
     
@@ -304,10 +306,8 @@ class MainSurveyDialog(BaseDialog):
         # If no phone provided, show error
         if not phone:
             progress = self._get_progress_bar(7, 7)
-            message = f"{progress}\n{localization.t('invalid_phone', lang)}\n\n{localization.t('ask_phone', lang)}"
-            send_phone_btn = localization.t('send_phone', lang)
-            keyboard = [[KeyboardButton(send_phone_btn, request_contact=True)]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+            message = f"{progress}\n{_t('invalid_phone', lang)}\n\n{_t('ask_phone', lang)}"
+            reply_markup = _phone_kb(lang)
             return self.create_step(message, next_step=self._process_phone, reply_markup=reply_markup)
         
         # Validate phone input
@@ -315,10 +315,8 @@ class MainSurveyDialog(BaseDialog):
         
         if not validation_result.is_valid:
             progress = self._get_progress_bar(7, 7)
-            message = f"{progress}\n{validation_result.error_message}\n\n{localization.t('ask_phone', lang)}"
-            send_phone_btn = localization.t('send_phone', lang)
-            keyboard = [[KeyboardButton(send_phone_btn, request_contact=True)]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+            message = f"{progress}\n{validation_result.error_message}\n\n{_t('ask_phone', lang)}"
+            reply_markup = _phone_kb(lang)
             return self.create_step(message, next_step=self._process_phone, reply_markup=reply_markup)
         
         # Save validated and sanitized phone data
@@ -329,10 +327,10 @@ class MainSurveyDialog(BaseDialog):
         """Survey completion step"""
         try:
             # Save data to Google Sheets
-            self._save_to_sheets(context)
+            saved = self._save_to_sheets(context)
             
             # Send lead to Telegram bot
-            self._send_lead_to_bot(context)
+            self._send_lead_to_bot(context, saved)
             
             # Mark as completed
             self.mark_completed(context)
@@ -344,47 +342,57 @@ class MainSurveyDialog(BaseDialog):
             logger.error(f"Error in completion step: {e}")
             return self.handle_error(context, e, "Произошла ошибка при сохранении данных.")
     
-    def _save_to_sheets(self, context: Context) -> None:
-        """Save user data to Google Sheets"""
+    def _save_to_sheets(self, context: Context) -> Future:
+        """Save user data to Google Sheets (in background)"""
+        ud = self.get_all_user_data(context)
         data = [
-            self.get_user_data(context, "telegram_id") or "",
-            self.get_user_data(context, "telegram_username") or "",
-            self.get_user_data(context, "phone") or "",
-            self.get_user_data(context, "user_name"),
+            ud.get("telegram_id") or "",
+            ud.get("telegram_username") or "",
+            ud.get("phone") or "",
+            ud.get("user_name"),
             "English",  # Fixed language for English school
-            self.get_user_data(context, "level"),
-            self.get_user_data(context, "goals"),
-            self.get_user_data(context, "format"),
-            self.get_user_data(context, "expectations"),
-            self.get_user_data(context, "start_date")
+            ud.get("level"),
+            ud.get("goals"),
+            ud.get("format"),
+            ud.get("expectations"),
+            ud.get("start_date")
         ]
-        cached_sheets_service.append_user_row(data)
+        return _submit_io(cached_sheets_service.append_user_row, data)
     
-    def _send_lead_to_bot(self, context: Context) -> None:
-        """Send lead data to workgroup chat"""
+    def _send_lead_to_bot(self, context: Context, saved: Future) -> None:
+        """Send lead data to workgroup chat (in background) and report a failed sheet save to the user"""
         try:
-            from datetime import datetime
-            
+            now = datetime.now()
+            ud = self.get_all_user_data(context)
+            tg_id = ud.get("telegram_id")
             lead_data = {
-                "name": self.get_user_data(context, "user_name"),
-                "phone": self.get_user_data(context, "phone"),
+                "name": ud.get("user_name"),
+                "phone": ud.get("phone"),
                 "language": "English",  # Fixed for English school
-                "level": self.get_user_data(context, "level"),
-                "goals": self.get_user_data(context, "goals"),
-                "format": self.get_user_data(context, "format"),
-                "expectations": self.get_user_data(context, "expectations"),
-                "schedule": self.get_user_data(context, "start_date"),
-                "telegram_id": self.get_user_data(context, "telegram_id"),
-                "telegram_username": self.get_user_data(context, "telegram_username"),
-                "timestamp": datetime.now().strftime("%d.%m.%Y %H:%M")
+                "level": ud.get("level"),
+                "goals": ud.get("goals"),
+                "format": ud.get("format"),
+                "expectations": ud.get("expectations"),
+                "schedule": ud.get("start_date"),
+                "telegram_id": tg_id,
+                "telegram_username": ud.get("telegram_username"),
+                "timestamp": f"{now.day:02d}.{now.month:02d}.{now.year} {now.hour:02d}:{now.minute:02d}"
             }
             
-            # Send lead to workgroup chat
-            success = leads_sender.send_lead_sync(lead_data)
-            if success:
-                logger.info(f"Lead sent to workgroup chat successfully for user {self.get_user_data(context, 'telegram_id')}")
-            else:
-                logger.warning(f"Failed to send lead to workgroup chat for user {self.get_user_data(context, 'telegram_id')}")
+            def deliver() -> None:
+                # Send lead to workgroup chat
+                success = leads_sender.send_lead_sync(lead_data)
+                if success:
+                    logger.info(f"Lead sent to workgroup chat successfully for user {tg_id}")
+                else:
+                    logger.warning(f"Failed to send lead to workgroup chat for user {tg_id}")
+                # _IO_POOL однопоточный: запись в таблицу к этому моменту уже завершилась.
+                # Неудачная запись отброшена (не повторяется), поэтому о ней можно сообщить
+                if saved.exception() is not None or not saved.result():
+                    message = SAVE_ERROR_LEAD_SENT_MESSAGE if success else SAVE_ERROR_MESSAGE
+                    leads_sender.send_message_sync(tg_id, message)
+            
+            _submit_io(deliver)
                 
         except Exception as e:
             logger.error(f"Error sending lead to workgroup chat: {e}")
@@ -403,9 +411,16 @@ class MainSurveyDialog(BaseDialog):
     
     def _get_progress_bar(self, current: int, total: int, length: int = 8) -> str:
         """Generate progress bar"""
+        if total == 7 and length == 8:
+            return _PROGRESS_BARS[current]
         filled = int(length * current / total)
         bar = "■" * filled + "□" * (length - filled)
         return bar
 
+# Проверяем таблицу шагов при импорте: опечатка в next сломала бы опрос посреди диалога
+for _name, _spec in _STEPS.items():
+    if _spec.next not in _STEPS and not hasattr(MainSurveyDialog, f"_{_spec.next}_step"):
+        raise ValueError(f"Survey step {_name!r} points to unknown step {_spec.next!r}")
+
 # Create and register the main survey dialog
 main_survey = MainSurveyDialog()
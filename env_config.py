@@ -12,11 +12,18 @@ SHEET_NAME = os.getenv('SHEET_NAME', 'KingSpeechLeads')
 MANAGER_CHAT_ID = os.getenv('MANAGER_CHAT_ID', '310075847')
 WORKGROUP_CHAT_ID = os.getenv('WORKGROUP_CHAT_ID')
 
-print("=== KingSpeech Bot Configuration ===")
-print(f"Bot: @kingspeechbot")
-print(f"TELEGRAM_BOT_TOKEN: {TELEGRAM_BOT_TOKEN[:10]}..." if TELEGRAM_BOT_TOKEN else "NOT SET")
-print(f"SPREADSHEET_ID: {SPREADSHEET_ID}")
-print(f"SHEET_NAME: {SHEET_NAME}")
-print(f"MANAGER_CHAT_ID: {MANAGER_CHAT_ID}")
-print(f"WORKGROUP_CHAT_ID: {WORKGROUP_CHAT_ID}")
-print("===================================")
+
+def print_config():
+    """Print the effective configuration (for manual checks)"""
+    print("=== KingSpeech Bot Configuration ===")
+    print(f"Bot: @kingspeechbot")
+    print(f"TELEGRAM_BOT_TOKEN: {TELEGRAM_BOT_TOKEN[:10]}..." if TELEGRAM_BOT_TOKEN else "NOT SET")
+    print(f"SPREADSHEET_ID: {SPREADSHEET_ID}")
+    print(f"SHEET_NAME: {SHEET_NAME}")
+    print(f"MANAGER_CHAT_ID: {MANAGER_CHAT_ID}")
+    print(f"WORKGROUP_CHAT_ID: {WORKGROUP_CHAT_ID}")
+    print("===================================")
+
+# Import stays silent; set KS_LOG_CONFIG=1 to get the summary at startup
+if __name__ == "__main__" or os.getenv("KS_LOG_CONFIG"):
+    print_config()
@@ -3,6 +3,7 @@
 Fixed KingSpeech Bot - Solves all Windows + asyncio issues
 """
 
+import importlib.util
 import logging
 import sys
 import os
@@ -24,8 +25,10 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def start_command(update, context):
-    """Start command handler - SYNCHRONOUS VERSION"""
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+async def start_command(update, context):
+    """Start command handler"""
     user = update.effective_user
     chat_id = update.effective_chat.id
     
@@ -33,8 +36,7 @@ def start_command(update, context):
     logger.info(f"User: {user.first_name} {user.last_name} (@{user.username})")
     
     try:
-        # Use synchronous version
-        update.message.reply_text(
+        await update.message.reply_text(
             "Привет! Бот KingSpeech работает! 🎉\n\n"
             "Доступные команды:\n"
             "/start - Начать работу\n"
@@ -45,13 +47,13 @@ def start_command(update, context):
     except Exception as e:
         logger.error(f"Error sending start reply: {e}")
 
-def help_command(update, context):
-    """Help command handler - SYNCHRONOUS VERSION"""
+async def help_command(update, context):
+    """Help command handler"""
     user = update.effective_user
     logger.info(f"Received /help from user {user.id}")
     
     try:
-        update.message.reply_text(
+        await update.message.reply_text(
             "Это тестовый бот KingSpeech.\n\n"
             "Команды:\n"
             "/start - Начать работу\n"
@@ -62,49 +64,64 @@ def help_command(update, context):
     except Exception as e:
         logger.error(f"Error sending help reply: {e}")
 
-def test_command(update, context):
-    """Test command handler - SYNCHRONOUS VERSION"""
+async def test_command(update, context):
+    """Test command handler"""
     user = update.effective_user
     logger.info(f"Received /test from user {user.id}")
     
     try:
-        update.message.reply_text("Тестовая команда работает! ✅")
+        await update.message.reply_text("Тестовая команда работает! ✅")
         logger.info("Test command reply sent successfully")
     except Exception as e:
         logger.error(f"Error sending test reply: {e}")
 
-def handle_message(update, context):
-    """Handle all text messages - SYNCHRONOUS VERSION"""
+async def handle_message(update, context):
+    """Handle all text messages"""
     user = update.effective_user
     text = update.message.text
     
     logger.info(f"Received message from user {user.id}: {text}")
     
     try:
-        update.message.reply_text(f"Вы написали: {text}")
+        await update.message.reply_text(f"Вы написали: {text}")
         logger.info("Message reply sent successfully")
     except Exception as e:
         logger.error(f"Error sending message reply: {e}")
 
-def error_handler(update, context):
+# Command name -> handler
+COMMANDS = {
+    "start": start_command,
+    "help": help_command,
+    "test": test_command,
+}
+
+async def error_handler(update, context):
     """Handle errors"""
     logger.error(f"Exception while handling an update: {context.error}")
     logger.error(f"Update: {update}")
 
 def main():
-    """Main function - SYNCHRONOUS VERSION"""
+    """Main function"""
     logger.info("Starting KingSpeech Bot...")
     logger.info(f"Token: {TELEGRAM_BOT_TOKEN[:10]}...")
     
     try:
         # Create application
-        app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # Updates are handled concurrently; HTTP/2 (needs the optional h2 package)
+        # multiplexes outgoing requests over one connection
+        http_version = "2" if HTTP2_AVAILABLE else "1.1"
+        app = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(True)
+            .http_version(http_version)
+            .get_updates_http_version(http_version)
+            .build()
+        )
         logger.info("Application created successfully")
         
         # Add handlers
-        app.add_handler(CommandHandler("start", start_command))
-        app.add_handler(CommandHandler("help", help_command))
-        app.add_handler(CommandHandler("test", test_command))
+        app.add_handlers([CommandHandler(name, callback) for name, callback in COMMANDS.items()])
         app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
         
         # Add error handler
@@ -115,8 +132,8 @@ def main():
         logger.info("Bot is starting polling...")
         logger.info("Send /start to your bot to test it!")
         
-        # Start polling - SYNCHRONOUS VERSION (no await)
-        app.run_polling(drop_pending_updates=True)
+        # Start polling (PTB runs the event loop)
+        app.run_polling(drop_pending_updates=True, timeout=30, poll_interval=0.0, bootstrap_retries=-1)
         
     except Exception as e:
         logger.error(f"Error in main: {e}")
@@ -5,26 +5,56 @@ Simple health check endpoint for Render
 
 import os
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import selectors
+import socket
 import threading
 
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'OK')
-        else:
-            self.send_response(404)
-            self.end_headers()
+HEALTH_PORT = 10000
+
+# Responses are fixed, so they are prebuilt once; the probe only needs the request line
+_OK_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 2\r\n"
+    b"Connection: close\r\n\r\n"
+    b"OK"
+)
+_NOT_FOUND_RESPONSE = (
+    b"HTTP/1.1 404 Not Found\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+def _accept(sel, server):
+    conn, _ = server.accept()
+    conn.setblocking(False)
+    sel.register(conn, selectors.EVENT_READ, _respond)
+
+def _respond(sel, conn):
+    try:
+        request = conn.recv(1024)
+        if request:
+            conn.sendall(_OK_RESPONSE if request.startswith(b"GET /health ") else _NOT_FOUND_RESPONSE)
+    except OSError:
+        pass
+    finally:
+        sel.unregister(conn)
+        conn.close()
 
 def start_health_server():
     """Start health check server on port 10000"""
     try:
-        server = HTTPServer(('0.0.0.0', 10000), HealthCheckHandler)
-        print("Health check server started on port 10000")
-        server.serve_forever()
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('0.0.0.0', HEALTH_PORT))
+        server.listen(64)
+        server.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(server, selectors.EVENT_READ, _accept)
+        print(f"Health check server started on port {HEALTH_PORT}")
+        while True:
+            for key, _ in sel.select():
+                key.data(sel, key.fileobj)
     except Exception as e:
         print(f"Health check server error: {e}")
 
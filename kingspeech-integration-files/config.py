@@ -1,17 +1,54 @@
 # config.py
 import os
+import sys
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
-load_dotenv()
+# .env читаем один раз на процесс, даже если модуль импортируется из разных мест
+if not os.environ.get("_KS_ENV_LOADED"):
+    load_dotenv()
+    os.environ["_KS_ENV_LOADED"] = "1"
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Неизменяемый снимок настроек, собранный один раз при импорте"""
+    spreadsheet_id: Optional[str]
+    sheet_name: str
+    telegram_bot_token: Optional[str]
+    manager_chat_id: int
+    workgroup_chat_id: Optional[str]
+
+
+def _parse_chat_id(name: str, raw: str) -> int:
+    """Преобразует chat id в int один раз при импорте с понятной ошибкой"""
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} должен быть целым числом, получено: {raw!r}") from None
+
 
 # Все настройки через переменные окружения
-SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
-SHEET_NAME = os.getenv("SHEET_NAME", "KingSpeechLeads")
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-MANAGER_CHAT_ID = int(os.getenv("MANAGER_CHAT_ID", "0"))
+CONFIG = Config(
+    spreadsheet_id=os.getenv("SPREADSHEET_ID"),
+    # Интернируем: имя листа используется как ключ словарей и в диапазонах
+    sheet_name=sys.intern(os.getenv("SHEET_NAME", "KingSpeechLeads")),
+    telegram_bot_token=os.getenv("TELEGRAM_BOT_TOKEN"),
+    manager_chat_id=_parse_chat_id("MANAGER_CHAT_ID", os.getenv("MANAGER_CHAT_ID", "0")),
+    # Настройки для пересылки лидов в чат рабочей группы
+    workgroup_chat_id=os.getenv("WORKGROUP_CHAT_ID"),  # Chat ID рабочей группы
+)
+
+# Модульные имена сохранены для совместимости с существующими импортами
+SPREADSHEET_ID = CONFIG.spreadsheet_id
+SHEET_NAME = CONFIG.sheet_name
+TELEGRAM_BOT_TOKEN = CONFIG.telegram_bot_token
+MANAGER_CHAT_ID = CONFIG.manager_chat_id
+WORKGROUP_CHAT_ID = CONFIG.workgroup_chat_id
 
 # Валидация обязательных переменных
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN не установлен в переменных окружения")
 if not SPREADSHEET_ID:
-    raise ValueError("SPREADSHEET_ID не установлен в переменных окружения")
\ No newline at end of file
+    raise ValueError("SPREADSHEET_ID не установлен в переменных окружения")
@@ -3,293 +3,451 @@
 KingSpeech Bot (@kingspeechbot) - Fixed for Windows
 """
 
+import asyncio
 import logging
 import sys
 import os
-from typing import Callable, Dict, Optional
+import secrets
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from importlib.util import find_spec
+from typing import Awaitable, Callable, Dict, List, Optional
 
 # Import environment configuration first
 import env_config
 
-# Add current directory to path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.ext import Application, AIORateLimiter, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from config import TELEGRAM_BOT_TOKEN
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton, MessageEntity, ReplyKeyboardMarkup
 from telegram import Update
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
 
 # Dialog system
 from cursor import Context, Step
 from services.dialog_manager import dialog_manager
+from services.session_store import session_store, step_tag, resolve_step
 from dialogs import load_all_dialogs
 
-# Enable detailed logging
+# Logging level is configurable; per-update messages are DEBUG
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    level=os.getenv("LOG_LEVEL", "WARNING").upper()
 )
 
 logger = logging.getLogger(__name__)
 
-# Simple per-user dialog contexts and step progression
-user_contexts: Dict[int, Context] = {}
-user_next_step: Dict[int, Optional[Callable]] = {}
+# Public HTTPS URL of the service; when set, updates arrive via webhook instead of polling
+# (Render exposes RENDER_EXTERNAL_URL for web services automatically)
+PUBLIC_URL = (os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL") or "").rstrip("/")
+PORT = int(os.getenv("PORT", "10000"))
+
+# HTTP/2 multiplexes outgoing Bot API calls over one connection (needs the h2 package)
+HTTP_VERSION = "2" if find_spec("h2") is not None else "1.1"
+
+@dataclass
+class UserSession:
+    """Per-user dialog context and step progression, kept in PTB's context.user_data"""
+    ctx: Context
+    step: str = ""  # step_tag of the pending step; "" once the dialog is completed
+
+# Free-list of cleared Context objects, reused instead of allocating one per session
+_CONTEXT_POOL: deque = deque(maxlen=512)
+
+def get_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> UserSession:
+    """Return the user's session, creating it on first access"""
+    session = context.user_data.get("session")
+    if session is None:
+        ctx = _CONTEXT_POOL.pop() if _CONTEXT_POOL else Context()
+        ctx.telegram = update.effective_user
+        session = context.user_data["session"] = UserSession(ctx=ctx)
+    return session
+
+def drop_session(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Forget the user's session and return its Context to the pool"""
+    session = context.user_data.pop("session", None)
+    if session is not None:
+        _CONTEXT_POOL.append(session.ctx.clear())
+
+async def restore_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Load the user's dialog state from the session store before the handlers run"""
+    user = update.effective_user
+    if user is None:
+        return
+    uid = str(user.id)
+    try:
+        data = await session_store.load(user.id)
+    except Exception as e:
+        logger.error(f"Failed to load session for user {user.id}: {e}")
+        return
+    
+    # The store is the source of truth: another worker may have advanced this user
+    drop_session(context)
+    dialog_manager.active_dialogs.pop(uid, None)
+    if not data:
+        return
+    
+    session = get_session(update, context)
+    for name, value in data["vars"].items():
+        session.ctx.set_variable(name, value)
+    branch = dialog_manager.get_branch(data["branch"]) if data["branch"] else None
+    if branch:
+        dialog_manager.active_dialogs[uid] = branch.name
+        session.step = data["step"]
+
+async def persist_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write the user's dialog state back to the session store after the handlers ran"""
+    user = update.effective_user
+    if user is None:
+        return
+    session = context.user_data.get("session")
+    try:
+        if session is None:
+            await session_store.delete(user.id)
+        else:
+            await session_store.save(
+                user.id,
+                dialog_manager.get_active_branch(str(user.id)),
+                session.step,
+                session.ctx.get_variables(),
+            )
+    except Exception as e:
+        logger.error(f"Failed to save session for user {user.id}: {e}")
+
+SEND_ATTEMPTS = 3
+
+async def _safe_send(send: Callable[[], Awaitable], attempts: int = SEND_ATTEMPTS):
+    """Run a Bot API call, waiting out flood control and retrying transient network errors.
+    
+    Anything else (and the last failed attempt) propagates to error_handler.
+    """
+    for attempt in range(attempts):
+        try:
+            return await send()
+        except RetryAfter as e:
+            if attempt == attempts - 1:
+                raise
+            logger.warning(f"Flood control, retrying in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+        except NetworkError as e:
+            # BadRequest is a NetworkError subclass but retrying it can't help
+            if isinstance(e, BadRequest) or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+# user_id -> [lock, number of updates holding or waiting for it]
+_user_locks: Dict[int, List] = {}
+
+def per_user(handler: Callable) -> Callable:
+    """Serialize updates of one user (updates of different users run concurrently).
+    
+    Also loads/saves the session around the handler when the Redis store is enabled.
+    """
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        if user is None:
+            return await handler(update, context)
+        
+        entry = _user_locks.get(user.id)
+        if entry is None:
+            entry = _user_locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if session_store.enabled:
+                    await restore_session(update, context)
+                try:
+                    return await handler(update, context)
+                finally:
+                    if session_store.enabled:
+                        await persist_session(update, context)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                # Nobody else is queued for this user - don't keep idle locks around
+                del _user_locks[user.id]
+    return wrapper
 
 LANGUAGE_OPTIONS = {
     "ru": "🇷🇺 Русский",
     "en": "🇬🇧 English",
 }
 
-def build_language_keyboard() -> InlineKeyboardMarkup:
-    keyboard = [
-        [InlineKeyboardButton(text=LANGUAGE_OPTIONS["ru"], callback_data="set_lang|ru")],
-        [InlineKeyboardButton(text=LANGUAGE_OPTIONS["en"], callback_data="set_lang|en")],
-    ]
-    return InlineKeyboardMarkup(keyboard)
+# Invariant replies are built once at import time
+LANGUAGE_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton(text=LANGUAGE_OPTIONS["ru"], callback_data="set_lang|ru")],
+    [InlineKeyboardButton(text=LANGUAGE_OPTIONS["en"], callback_data="set_lang|en")],
+])
+
+def _bold_entities(marked: str):
+    """Strip **bold** markers, returning plain text and BOLD entities (offsets in UTF-16 units)"""
+    text, entities, offset = [], [], 0
+    for i, part in enumerate(marked.split("**")):
+        length = len(part.encode("utf-16-le")) // 2
+        if i % 2 and length:
+            entities.append(MessageEntity(MessageEntity.BOLD, offset, length))
+        text.append(part)
+        offset += length
+    return "".join(text), tuple(entities)
+
+# Sent with precomputed entities, so Telegram doesn't parse Markdown on every /help
+HELP_TEXT, HELP_ENTITIES = _bold_entities(
+    "🤖 **KingSpeech Bot - Помощь**\n\n"
+    "**Доступные команды:**\n"
+    "/start - Начать опрос для подбора курса\n"
+    "/help - Показать это сообщение\n"
+    "/trash - Очистить данные и начать заново\n\n"
+    "**Как это работает:**\n"
+    "1. Выберите язык интерфейса\n"
+    "2. Пройдите короткий опрос (7 вопросов)\n"
+    "3. Получите персональные рекомендации\n\n"
+    "**Поддержка:**\n"
+    "Если у вас возникли вопросы, обратитесь к менеджеру."
+)
+
+START_HINT_TEXT = "Отправьте /start, чтобы начать диалог."
+SURVEY_START_ERROR_TEXT = "Произошла ошибка при запуске опроса."
 
+@per_user
 async def start_command(update, context):
     """Start command handler - ASYNC VERSION"""
     user = update.effective_user
+    uid = str(user.id)  # dialog_manager keys users by str id
     chat_id = update.effective_chat.id
     
-    logger.info(f"Received /start from user {user.id} in chat {chat_id}")
-    logger.info(f"User: {user.first_name} {user.last_name} (@{user.username})")
+    logger.debug("Received /start from user %s in chat %s", user.id, chat_id)
+    logger.debug("User: %s %s (@%s)", user.first_name, user.last_name, user.username)
     
-    try:
-        # Reset any existing session
-        dialog_manager.reset_user(str(user.id))
-        if user.id in user_contexts:
-            user_contexts.pop(user.id, None)
-        if user.id in user_next_step:
-            user_next_step.pop(user_id, None)
-        
-        # Create new context and session
-        user_contexts[user.id] = Context(telegram=update.effective_user)
-        
-        # Start the main survey directly - it will handle language selection if needed
-        step = dialog_manager.start_branch(str(user.id), "main_survey", user_contexts[user.id])
-        if step and step.next_step is not None:
-            await send_step_message(update, context, step)
-        else:
-            # Language not selected, show language selection
-            await update.message.reply_text(
-                "Пожалуйста, выберите язык интерфейса:",
-                reply_markup=build_language_keyboard(),
-            )
-        logger.info("Start command reply sent successfully")
-    except Exception as e:
-        logger.error(f"Error sending start reply: {e}")
+    # Reset any existing session
+    dialog_manager.reset_user(uid)
+    drop_session(context)
+    
+    # Create new context and session
+    session = get_session(update, context)
+    
+    # Start the main survey directly - it will handle language selection if needed
+    step = dialog_manager.start_branch(uid, "main_survey", session.ctx)
+    if step and step.next_step is not None:
+        await send_step_message(update, context, step)
+    else:
+        # Language not selected, show language selection
+        await _safe_send(lambda: update.message.reply_text(
+            "Пожалуйста, выберите язык интерфейса:",
+            reply_markup=LANGUAGE_KB,
+        ))
+    logger.debug("Start command reply sent successfully")
 
 async def help_command(update, context):
     """Help command handler - ASYNC VERSION"""
     user = update.effective_user
-    logger.info(f"Received /help from user {user.id}")
+    logger.debug("Received /help from user %s", user.id)
     
-    try:
-        help_text = (
-            "🤖 **KingSpeech Bot - Помощь**\n\n"
-            "**Доступные команды:**\n"
-            "/start - Начать опрос для подбора курса\n"
-            "/help - Показать это сообщение\n"
-            "/trash - Очистить данные и начать заново\n\n"
-            "**Как это работает:**\n"
-            "1. Выберите язык интерфейса\n"
-            "2. Пройдите короткий опрос (7 вопросов)\n"
-            "3. Получите персональные рекомендации\n\n"
-            "**Поддержка:**\n"
-            "Если у вас возникли вопросы, обратитесь к менеджеру."
-        )
-        await update.message.reply_text(help_text, parse_mode='Markdown')
-        logger.info("Help command reply sent successfully")
-    except Exception as e:
-        logger.error(f"Error sending help reply: {e}")
+    await _safe_send(lambda: update.message.reply_text(HELP_TEXT, entities=HELP_ENTITIES))
+    logger.debug("Help command reply sent successfully")
 
 async def test_command(update, context):
     """Test command handler - ASYNC VERSION"""
     user = update.effective_user
-    logger.info(f"Received /test from user {user.id}")
+    logger.debug("Received /test from user %s", user.id)
     
-    try:
-        await update.message.reply_text("KingSpeech Bot работает корректно! ✅")
-        logger.info("Test command reply sent successfully")
-    except Exception as e:
-        logger.error(f"Error sending test reply: {e}")
+    await _safe_send(lambda: update.message.reply_text("KingSpeech Bot работает корректно! ✅"))
+    logger.debug("Test command reply sent successfully")
 
+@per_user
 async def trash_command(update, context):
     """Reset user state"""
-    try:
-        user_id = update.effective_user.id
-        dialog_manager.reset_user(str(user_id))
-        if user_id in user_contexts:
-            user_contexts.pop(user_id, None)
-        if user_id in user_next_step:
-            user_next_step.pop(user_id, None)
-        await update.message.reply_text(
-            "Хорошо, давайте начнем сначала!\nОтправьте /start, чтобы начать новый диалог."
-        )
-    except Exception as e:
-        logging.exception(e)
+    dialog_manager.reset_user(str(update.effective_user.id))
+    drop_session(context)
+    await _safe_send(lambda: update.message.reply_text(
+        "Хорошо, давайте начнем сначала!\nОтправьте /start, чтобы начать новый диалог."
+    ))
 
+@per_user
 async def handle_message(update, context):
     """Handle all text messages and contacts - ASYNC VERSION"""
     user = update.effective_user
+    uid = str(user.id)
     text = update.message.text or ""
     contact = update.message.contact
-    logger.info(f"Received message from user {user.id}: {text}")
+    logger.debug("Received message from user %s: %s", user.id, text)
+
+    # Check if user has an active dialog session (started with /start) before touching any state
+    active_branch = dialog_manager.get_active_branch(uid)
+    if not active_branch:
+        # No active session - ignore message (don't respond)
+        logger.debug("User %s has no active session - ignoring message", user.id)
+        return
 
     # Ensure context exists
-    if user.id not in user_contexts:
-        user_contexts[user.id] = Context(telegram=update.effective_user)
-    current_context = user_contexts[user.id]
+    session = get_session(update, context)
+    current_context = session.ctx
     
     # Handle contact sharing
     if contact:
-        logger.info(f"Received contact from user {user.id}: {contact.phone_number}")
+        logger.debug("Received contact from user %s: %s", user.id, contact.phone_number)
         # Set contact in context for dialog processing
         current_context.contact = contact
         current_context.set_user_message(contact.phone_number)
     else:
         current_context.set_user_message(text)
-
-    # Check if user has an active dialog session (started with /start)
-    active_branch = dialog_manager.get_active_branch(str(user.id))
-    if not active_branch:
-        # No active session - ignore message (don't respond)
-        logger.info(f"User {user.id} has no active session - ignoring message")
-        return
     
     # Check if dialog is completed (no next_step)
-    next_step = user_next_step.get(user.id)
-    if next_step is None:
+    if not session.step:
         # Dialog is completed - clean up and ignore message
-        logger.info(f"User {user.id} dialog completed - cleaning up session")
-        dialog_manager.end_branch(str(user.id))
-        if user.id in user_contexts:
-            user_contexts.pop(user.id, None)
-        if user.id in user_next_step:
-            user_next_step.pop(user.id, None)
+        logger.debug("User %s dialog completed - cleaning up session", user.id)
+        dialog_manager.end_branch(uid)
+        drop_session(context)
         return
 
-    # If we have a pending step, route to it
-    if next_step:
-        try:
-            step = next_step(current_context, choice=text or (contact.phone_number if contact else None))
-            if step and hasattr(step, 'message') and step.message:
-                await send_step_message(update, context, step)
-                return
-            else:
-                logger.warning(f"next_step returned invalid step for user {user.id}")
-        except Exception as e:
-            logger.error(f"Error in next_step: {e}")
-            # Don't end the dialog on error, just show error message
-            await update.message.reply_text("Произошла ошибка. Пожалуйста, попробуйте еще раз или отправьте /start для перезапуска.")
-            return
+    # We have a pending step, route to it
+    if await _advance(
+        update, context, session,
+        text or (contact.phone_number if contact else None),
+        "Произошла ошибка. Пожалуйста, попробуйте еще раз или отправьте /start для перезапуска.",
+    ):
+        return
 
     # Route to active branch - only if we don't have a pending step
     branch = dialog_manager.get_branch(active_branch)
     if branch:
         # Don't call entry_point again - let the dialog handle the current step
         # Just send a message to continue the dialog
-        await update.message.reply_text("Пожалуйста, продолжите диалог или отправьте /start для перезапуска.")
+        await _safe_send(lambda: update.message.reply_text("Пожалуйста, продолжите диалог или отправьте /start для перезапуска."))
     else:
         # Clean up invalid state
-        dialog_manager.end_branch(str(user.id))
-        await update.message.reply_text("Сессия завершена. Отправьте /start, чтобы начать новый диалог.")
+        dialog_manager.end_branch(uid)
+        await _safe_send(lambda: update.message.reply_text("Сессия завершена. Отправьте /start, чтобы начать новый диалог."))
+
+def _pending_step(uid: str, session: UserSession) -> Optional[Callable]:
+    """Resolve the session's step tag against the dialog of the user's active branch"""
+    branch = dialog_manager.get_branch(dialog_manager.get_active_branch(uid) or "")
+    if branch is None:
+        return None
+    return resolve_step(getattr(branch.entry_point, "__self__", None), session.step)
+
+async def _advance(update: Update, context: ContextTypes.DEFAULT_TYPE, session: UserSession,
+                   choice: Optional[str], error_text: str) -> bool:
+    """Run the session's pending step with the user's choice and render the result.
+    
+    Returns False only if the step produced nothing to send.
+    """
+    next_step = _pending_step(str(update.effective_user.id), session)
+    if next_step is None:
+        logger.warning(f"Unresolvable step {session.step!r} for user {update.effective_user.id}")
+        return False
+    
+    try:
+        step = next_step(session.ctx, choice=choice)
+    except Exception as e:
+        logger.error(f"Error in next_step: {e}")
+        # Don't end the dialog on error, just show error message
+        await _safe_send(lambda: update.effective_message.reply_text(error_text))
+        return True
+    
+    if not step or not step.message:
+        logger.warning(f"next_step returned invalid step for user {update.effective_user.id}")
+        return False
+    await send_step_message(update, context, step)
+    return True
 
 async def error_handler(update, context):
     """Handle errors"""
-    logger.error(f"Exception while handling an update: {context.error}")
+    logger.error(f"Exception while handling an update: {context.error}", exc_info=context.error)
     logger.error(f"Update: {update}")
 
+async def _set_lang(update: Update, context: ContextTypes.DEFAULT_TYPE, session: UserSession, lang: str) -> None:
+    """Language selection (only allowed if user has started with /start)"""
+    query = update.callback_query
+    active_branch = dialog_manager.get_active_branch(str(update.effective_user.id))
+    if not active_branch:
+        await _safe_send(lambda: query.message.reply_text(START_HINT_TEXT))
+        return
+        
+    if lang not in LANGUAGE_OPTIONS:
+        await _safe_send(lambda: query.message.reply_text("Неизвестный язык."))
+        return
+    session.ctx.set_variable("interface_lang", lang)
+    
+    # Continue with the main survey - don't end and restart the branch
+    branch = dialog_manager.get_branch(active_branch)
+    if branch:
+        try:
+            step = branch.entry_point(session.ctx)
+            if step:
+                await send_step_message(update, context, step)
+            else:
+                await _safe_send(lambda: query.message.reply_text(SURVEY_START_ERROR_TEXT))
+        except Exception as e:
+            logger.error(f"Error in branch entry point: {e}")
+            await _safe_send(lambda: query.message.reply_text(SURVEY_START_ERROR_TEXT))
+    else:
+        await _safe_send(lambda: query.message.reply_text(SURVEY_START_ERROR_TEXT))
+
+async def _start_branch(update: Update, context: ContextTypes.DEFAULT_TYPE, session: UserSession, branch_name: str) -> None:
+    """Start specific branch (only allowed if user has started with /start)"""
+    query = update.callback_query
+    uid = str(update.effective_user.id)
+    if not dialog_manager.get_active_branch(uid):
+        await _safe_send(lambda: query.message.reply_text(START_HINT_TEXT))
+        return
+        
+    step = dialog_manager.start_branch(uid, branch_name, session.ctx)
+    if step:
+        await send_step_message(update, context, step)
+    else:
+        await _safe_send(lambda: query.message.reply_text("Произошла ошибка при запуске диалога."))
+
+# callback_data prefix -> handler(update, context, session, payload)
+CALLBACK_ROUTES: Dict[str, Callable[..., Awaitable[None]]] = {
+    "set_lang": _set_lang,
+    "start_branch": _start_branch,
+}
+
+@per_user
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle callback queries"""
     user = update.effective_user
+    uid = str(user.id)
     query = update.callback_query
-    await query.answer()
-
-    # Ensure context exists
-    if user.id not in user_contexts:
-        user_contexts[user.id] = Context(telegram=update.effective_user)
-    current_context = user_contexts[user.id]
+    await _safe_send(query.answer)
 
     data = query.data or ""
-    logger.info(f"Received callback from user {user.id}: {data}")
-
-    # Language selection (only allowed if user has started with /start)
-    if data.startswith("set_lang|"):
-        # Check if user has an active session
-        active_branch = dialog_manager.get_active_branch(str(user.id))
-        if not active_branch:
-            await query.message.reply_text("Отправьте /start, чтобы начать диалог.")
-            return
-            
-        lang = data.split("|", 1)[1]
-        if lang not in ("ru", "en"):
-            await query.message.reply_text("Неизвестный язык.")
-            return
-        current_context.set_variable("interface_lang", lang)
-        
-        # Continue with the main survey - don't end and restart the branch
-        branch = dialog_manager.get_branch(active_branch)
-        if branch:
-            try:
-                step = branch.entry_point(current_context)
-                if step:
-                    await send_step_message(update, context, step)
-                else:
-                    await query.message.reply_text("Произошла ошибка при запуске опроса.")
-            except Exception as e:
-                logger.error(f"Error in branch entry point: {e}")
-                await query.message.reply_text("Произошла ошибка при запуске опроса.")
-        else:
-            await query.message.reply_text("Произошла ошибка при запуске опроса.")
-        return
+    logger.debug("Received callback from user %s: %s", user.id, data)
 
-    # Start specific branch (only allowed if user has started with /start)
-    if data.startswith("start_branch|"):
-        # Check if user has an active session
-        active_branch = dialog_manager.get_active_branch(str(user.id))
-        if not active_branch:
-            await query.message.reply_text("Отправьте /start, чтобы начать диалог.")
-            return
-            
-        branch_name = data.split("|", 1)[1]
-        step = dialog_manager.start_branch(str(user.id), branch_name, current_context)
-        if step:
-            await send_step_message(update, context, step)
-        else:
-            await query.message.reply_text("Произошла ошибка при запуске диалога.")
+    # Every callback flow needs a dialog started with /start - reject before touching any state
+    active_branch = dialog_manager.get_active_branch(uid)
+    if not active_branch:
+        await _safe_send(lambda: query.message.reply_text(START_HINT_TEXT))
         return
 
-    # In-branch callback flow
-    active_branch = dialog_manager.get_active_branch(str(user.id))
-    if not active_branch:
-        await query.message.reply_text("Отправьте /start, чтобы начать диалог.")
+    # Ensure context exists
+    session = get_session(update, context)
+    current_context = session.ctx
+
+    # Service callbacks are "action|payload"; plain option labels fall through to the dialog
+    action, sep, payload = data.partition("|")
+    route = CALLBACK_ROUTES.get(action) if sep else None
+    if route:
+        await route(update, context, session, payload)
         return
 
+    # In-branch callback flow
     branch = dialog_manager.get_branch(active_branch)
     if not branch:
-        await query.message.reply_text("Произошла ошибка. Пожалуйста, начните сначала с /start")
+        await _safe_send(lambda: query.message.reply_text("Произошла ошибка. Пожалуйста, начните сначала с /start"))
         return
 
     # If we have a pending step, pass the choice
-    next_step = user_next_step.get(user.id)
-    if next_step:
-        try:
-            step = next_step(current_context, choice=data)
-            await send_step_message(update, context, step)
-            return
-        except Exception as e:
-            logger.error(f"Error in next_step(callback): {e}")
-            # Don't end the dialog on error, just show error message
-            await query.message.reply_text("Произошла ошибка. Пожалуйста, попробуйте еще раз.")
-            return
+    if session.step:
+        await _advance(update, context, session, data, "Произошла ошибка. Пожалуйста, попробуйте еще раз.")
+        return
 
     # If no pending step, try to get the current step from the branch
     try:
         step = branch.entry_point(current_context)
-        if step and hasattr(step, 'message') and step.message:
+        if step and step.message:
             await send_step_message(update, context, step)
             return
         else:
@@ -298,84 +456,133 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.error(f"Error getting branch entry point: {e}")
 
     # Fallback - if no pending step and no branch entry point, end the dialog
-    dialog_manager.end_branch(str(user.id))
-    await query.message.reply_text("Диалог завершен. Используйте /start для нового диалога.")
+    dialog_manager.end_branch(uid)
+    await _safe_send(lambda: query.message.reply_text("Диалог завершен. Используйте /start для нового диалога."))
+
+@lru_cache(maxsize=256)
+def _inline_kb(options: tuple) -> InlineKeyboardMarkup:
+    """One-button-per-row inline keyboard for a step's options (shared across users)"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(o, callback_data=o)] for o in options])
 
 async def send_step_message(update: Update, context: ContextTypes.DEFAULT_TYPE, step: Step) -> None:
     """Render a Step to Telegram with optional inline/reply keyboards"""
-    if not step or not hasattr(step, 'message'):
+    if not step:
         logger.error("Invalid step object received")
         return
         
-    reply_markup = getattr(step, 'reply_markup', None)
-    options = getattr(step, 'options', None)
+    reply_markup = step.reply_markup
+    options = step.options
     
     # Persist next_step for progression
     user_id = (update.effective_user.id if update.effective_user else None)
     if user_id is not None:
-        next_step = getattr(step, 'next_step', None)
-        user_next_step[user_id] = next_step
+        next_step = step.next_step
+        get_session(update, context).step = step_tag(next_step)
         
         # If no next_step, the dialog is completed - clean up
         if next_step is None:
-            logger.info(f"Dialog completed for user {user_id} - cleaning up")
+            logger.debug("Dialog completed for user %s - cleaning up", user_id)
             # Don't immediately end the branch here, let the user see the completion message
 
     # If it's a reply keyboard, always send new message
     if isinstance(reply_markup, ReplyKeyboardMarkup):
-        if getattr(update, "message", None):
-            await update.message.reply_text(text=step.message, reply_markup=reply_markup)
-        elif getattr(update, "callback_query", None):
-            await update.callback_query.message.reply_text(text=step.message, reply_markup=reply_markup)
+        if update.message is not None:
+            await _safe_send(lambda: update.message.reply_text(text=step.message, reply_markup=reply_markup))
+        elif update.callback_query is not None:
+            await _safe_send(lambda: update.callback_query.message.reply_text(text=step.message, reply_markup=reply_markup))
         return
 
     # Inline or simple
-    if getattr(update, "callback_query", None):
+    if update.callback_query is not None:
         # Build inline keyboard from options if needed
         if options and not reply_markup:
-            keyboard = [[InlineKeyboardButton(opt, callback_data=opt)] for opt in options]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = _inline_kb(tuple(options))
         try:
-            await update.callback_query.edit_message_text(text=step.message, reply_markup=reply_markup)
-        except Exception:
-            await update.callback_query.message.reply_text(text=step.message, reply_markup=reply_markup)
+            if getattr(update.callback_query.message, "text", None) == step.message:
+                # Same text (e.g. toggling a multi-select option) - only the keyboard changes
+                await _safe_send(lambda: update.callback_query.edit_message_reply_markup(reply_markup=reply_markup))
+            else:
+                await _safe_send(lambda: update.callback_query.edit_message_text(text=step.message, reply_markup=reply_markup))
+        except BadRequest:
+            # Message can't be edited (too old, deleted, not modified) - send a new one
+            await _safe_send(lambda: update.callback_query.message.reply_text(text=step.message, reply_markup=reply_markup))
     else:
         if options and not reply_markup:
-            keyboard = [[InlineKeyboardButton(opt, callback_data=opt)] for opt in options]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(text=step.message, reply_markup=reply_markup)
+            reply_markup = _inline_kb(tuple(options))
+        await _safe_send(lambda: update.message.reply_text(text=step.message, reply_markup=reply_markup))
 
 def main():
     """Main function - SYNC runner with internal PTB loop"""
     logger.info("Starting KingSpeech Bot (@kingspeechbot)...")
     logger.info(f"Token: {TELEGRAM_BOT_TOKEN[:10]}...")
     
-    # Start health check server for Render
-    try:
-        from health_check import start_health_server
-        import threading
-        health_thread = threading.Thread(target=start_health_server, daemon=True)
-        health_thread.start()
-        logger.info("Health check server started")
-    except Exception as e:
-        logger.warning(f"Could not start health check server: {e}")
+    # libuv-based event loop for the PTB runner where available (not on Windows)
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            uvloop.install()
+            logger.info("Using uvloop event loop")
+        except ImportError:
+            pass
+    
+    # Standalone health check server is opt-in for polling deployments
+    # (in webhook mode the webhook listener owns PORT and answers the platform's port probe)
+    if not PUBLIC_URL and os.getenv("ENABLE_HEALTHCHECK"):
+        try:
+            from health_check import start_health_server
+            import threading
+            health_thread = threading.Thread(target=start_health_server, daemon=True)
+            health_thread.start()
+            logger.info("Health check server started")
+        except Exception as e:
+            logger.warning(f"Could not start health check server: {e}")
     
     try:
         # Load dialog branches (registers in dialog_manager)
         load_all_dialogs()
-        app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # Outgoing calls get a large pool and short timeouts; getUpdates keeps its own default client
+        request = HTTPXRequest(
+            connection_pool_size=256,
+            http_version=HTTP_VERSION,
+            connect_timeout=5.0,
+            read_timeout=10.0,
+            write_timeout=10.0,
+            pool_timeout=3.0,
+        )
+        builder = Application.builder().token(TELEGRAM_BOT_TOKEN).request(request).concurrent_updates(True)
+        if find_spec("aiolimiter") is not None:
+            # Keeps outgoing sends under Telegram's flood limits instead of hitting 429s
+            builder = builder.rate_limiter(AIORateLimiter())
+        app = builder.build()
         logger.info("Application created successfully")
-        app.add_handler(CommandHandler("start", start_command))
-        app.add_handler(CommandHandler("help", help_command))
-        app.add_handler(CommandHandler("test", test_command))
-        app.add_handler(CommandHandler("trash", trash_command))
-        app.add_handler(CallbackQueryHandler(handle_callback))
-        app.add_handler(MessageHandler((filters.TEXT | filters.CONTACT) & ~filters.COMMAND, handle_message))
+        if session_store.enabled:
+            logger.info("Redis session store enabled")
+        app.add_handlers([
+            CommandHandler("start", start_command),
+            CommandHandler("help", help_command),
+            CommandHandler("test", test_command),
+            CommandHandler("trash", trash_command),
+            CallbackQueryHandler(handle_callback),
+            MessageHandler((filters.TEXT | filters.CONTACT) & ~filters.COMMAND, handle_message),
+        ])
         app.add_error_handler(error_handler)
         logger.info("All handlers registered successfully")
-        logger.info("Bot is starting polling...")
         logger.info("Send /start to @kingspeechbot to test it!")
-        app.run_polling(drop_pending_updates=True)
+        if PUBLIC_URL:
+            # Secret path + X-Telegram-Bot-Api-Secret-Token header, regenerated on every start
+            secret = secrets.token_urlsafe(32)
+            logger.info(f"Bot is starting webhook on port {PORT} for {PUBLIC_URL}...")
+            app.run_webhook(
+                listen="0.0.0.0",
+                port=PORT,
+                url_path=secret,
+                webhook_url=f"{PUBLIC_URL}/{secret}",
+                secret_token=secret,
+                drop_pending_updates=True,
+            )
+        else:
+            logger.info("Bot is starting polling...")
+            app.run_polling(drop_pending_updates=True)
     except Exception as e:
         logger.error(f"Error in main: {e}")
         import traceback
@@ -6,16 +6,31 @@ import telegram
 import re
 import datetime
 import time
+import random
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from typing import Optional, Callable, Any
+from importlib.util import find_spec
+from typing import Optional, Callable, Any, Dict, List
+
+from cachetools import TTLCache
 
 # Fix for Windows event loop issues
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    # uvloop (libuv) быстрее стандартного цикла на сетевом вводе-выводе; необязателен
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.ext import AIORateLimiter, Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from telegram.error import TelegramError, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
 from cursor import Step, Dialog, Context, Variable, GoogleSheets
 from config import TELEGRAM_BOT_TOKEN, SPREADSHEET_ID, SHEET_NAME, MANAGER_CHAT_ID
 
@@ -43,6 +58,51 @@ logger = logging.getLogger(__name__)
 MAX_RETRIES = 3
 RETRY_DELAY = 1.0
 RATE_LIMIT_DELAY = 5.0
+MAX_BACKOFF = 30.0
+MAX_CONCURRENT_RETRIES = 8  # Одновременных повторов к Telegram API на весь бот
+IO_WORKERS = 8  # Потоки для блокирующих вызовов (Google Sheets)
+FINAL_STATUSES = ("В работе", "Обработано")
+# HTTP/2 мультиплексирует исходящие запросы к Bot API (нужен пакет h2)
+HTTP_VERSION = "2" if find_spec("h2") is not None else "1.1"
+
+# Номер телефона, введённый вручную (+7XXXXXXXXXX или 8XXXXXXXXXX)
+PHONE_RE = re.compile(r"^(\+7|8)\d{10}$")
+
+# Write-behind очередь обновлений статусов заявок
+STATUS_FLUSH_INTERVAL = 0.5
+STATUS_BATCH_MAX = 50
+STATUS_WRITE_ATTEMPTS = 3
+STATUS_RETRY_DELAY = 5.0
+# Элементы очереди: (telegram_id, reg_time, new_status, имя листа месяца на момент чтения)
+status_queue: asyncio.Queue = asyncio.Queue()
+# read_status и write_statuses переключают общий sheet.sheet_name из разных потоков пула
+_sheet_lock = threading.Lock()
+_status_writer_task: Optional[asyncio.Task] = None
+# Недавно известные статусы (telegram_id, reg_time) -> статус, чтобы не перечитывать таблицу
+known_statuses = TTLCache(maxsize=10_000, ttl=600)
+
+MONTH_SHEET_NAMES = (
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
+)
+
+# Полный traceback по одному месту логируем не чаще раза в TRACEBACK_LOG_INTERVAL секунд
+TRACEBACK_LOG_INTERVAL = 10.0
+_traceback_throttle: Dict[str, float] = {}
+
+def log_error(where: str, e: Exception) -> None:
+    """Log an error, formatting the traceback only once per interval for each call site"""
+    now = time.monotonic()
+    if now - _traceback_throttle.get(where, float("-inf")) > TRACEBACK_LOG_INTERVAL:
+        _traceback_throttle[where] = now
+        logger.error(f"{where}: {e}", exc_info=True)
+    else:
+        logger.error("%s: %r", where, e)
+
+# Ограничивает число повторных запросов, идущих одновременно.
+# Вложенные вызовы внутри повтора слот не занимают, иначе можно получить взаимоблокировку.
+_retry_semaphore = asyncio.Semaphore(MAX_CONCURRENT_RETRIES)
+_in_retry = contextvars.ContextVar("_in_retry", default=False)
 
 def retry_on_error(max_retries: int = MAX_RETRIES, delay: float = RETRY_DELAY):
     """Декоратор для повторных попыток при ошибках"""
@@ -52,12 +112,21 @@ def retry_on_error(max_retries: int = MAX_RETRIES, delay: float = RETRY_DELAY):
             last_exception = None
             for attempt in range(max_retries):
                 try:
-                    return await func(*args, **kwargs)
+                    if attempt == 0 or _in_retry.get():
+                        return await func(*args, **kwargs)
+                    async with _retry_semaphore:
+                        token = _in_retry.set(True)
+                        try:
+                            return await func(*args, **kwargs)
+                        finally:
+                            _in_retry.reset(token)
                 except (NetworkError, TimedOut) as e:
                     last_exception = e
                     if attempt < max_retries - 1:
                         logger.warning(f"Network error in {func.__name__}, attempt {attempt + 1}/{max_retries}: {e}")
-                        await asyncio.sleep(delay * (attempt + 1))
+                        # Экспоненциальная задержка с джиттером, чтобы повторы не шли синхронно
+                        sleep_for = min(MAX_BACKOFF, delay * (2 ** attempt)) * random.uniform(0.5, 1.5)
+                        await asyncio.sleep(sleep_for)
                     continue
                 except RetryAfter as e:
                     last_exception = e
@@ -75,6 +144,46 @@ def retry_on_error(max_retries: int = MAX_RETRIES, delay: float = RETRY_DELAY):
         return wrapper
     return decorator
 
+# user_id -> [lock, число апдейтов, которые держат или ждут блокировку]
+_user_locks: Dict[int, List] = {}
+
+# Повторное нажатие той же кнопки в течение окна считается дублем
+CALLBACK_DEDUP_WINDOW = 0.5
+_last_callbacks = TTLCache(maxsize=100_000, ttl=CALLBACK_DEDUP_WINDOW)
+
+def per_user(handler: Callable) -> Callable:
+    """Декоратор: апдейты одного пользователя обрабатываются по очереди, дубли нажатий отбрасываются"""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Any:
+        user = update.effective_user
+        if user is None:
+            return await handler(update, context)
+        
+        entry = _user_locks.get(user.id)
+        if entry is None:
+            entry = _user_locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                query = update.callback_query
+                if query is None:
+                    return await handler(update, context)
+                if _last_callbacks.get(user.id) == query.data:
+                    logger.info(f"Dropped duplicate callback from user {user.id}: {query.data}")
+                    await query.answer()
+                    return None
+                try:
+                    return await handler(update, context)
+                finally:
+                    # Окно отсчитывается от конца обработки: нажатия, ждавшие блокировку, тоже отсекаются
+                    _last_callbacks[user.id] = query.data
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                # Больше никто не ждёт - не храним блокировку простаивающего пользователя
+                del _user_locks[user.id]
+    return wrapper
+
 def safe_execute(func: Callable) -> Callable:
     """Декоратор для безопасного выполнения функций с обработкой ошибок"""
     @wraps(func)
@@ -82,7 +191,7 @@ def safe_execute(func: Callable) -> Callable:
         try:
             return await func(*args, **kwargs)
         except Exception as e:
-            logger.error(f"Error in {func.__name__}: {e}", exc_info=True)
+            log_error(f"Error in {func.__name__}", e)
             # Отправляем сообщение об ошибке пользователю
             if args and hasattr(args[0], 'message') and args[0].message:
                 try:
@@ -105,12 +214,57 @@ except Exception as e:
 # Создаем диалог
 dialog = Dialog()
 
-# Словарь для хранения контекста пользователей
-user_contexts = {}
+class UserContextCache(TTLCache):
+    """Контексты пользователей с ограничением по размеру и времени простоя.
+    
+    При вытеснении (LRU или истечение TTL) сбрасывается и состояние диалога пользователя.
+    """
+    
+    def popitem(self):
+        key, value = super().popitem()
+        dialog_manager.reset_user(str(key))
+        return key, value
+    
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, _ in expired:
+            dialog_manager.reset_user(str(key))
+        return expired
+
+# Контексты пользователей: не больше 100 000, неактивные дольше суток вытесняются
+user_contexts = UserContextCache(maxsize=100_000, ttl=24 * 3600)
+
+def _ctx(user_id: int, user) -> Context:
+    """Get or create the user's context, restarting its idle timer"""
+    ctx = user_contexts.get(user_id)
+    if ctx is None:
+        ctx = Context(telegram=user)
+    # TTLCache считает время от записи: перезапись продлевает срок, так что истекают только простаивающие
+    user_contexts[user_id] = ctx
+    return ctx
 
 # Глобальная переменная для хранения экземпляра приложения
 application = None
 
+# Приветственная клавиатура /start не меняется - собираем её один раз
+_START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Начать учиться с King Speech", callback_data="start_branch|main_survey")],
+    [InlineKeyboardButton("Пройти тест на знание языка", callback_data="start_branch|quick_test")]
+])
+
+# Разметка шагов диалога по набору вариантов: дерево диалогов фиксировано
+_markup_cache: Dict[tuple, InlineKeyboardMarkup] = {}
+
+def _inline_markup(options) -> InlineKeyboardMarkup:
+    """Inline keyboard with one button per option, shared between identical steps"""
+    key = tuple(options)
+    markup = _markup_cache.get(key)
+    if markup is None:
+        markup = _markup_cache[key] = InlineKeyboardMarkup(
+            [[InlineKeyboardButton(option, callback_data=option)] for option in key]
+        )
+    return markup
+
 # Загружаем все диалоговые ветки
 def initialize_dialogs():
     """Initialize all dialog branches"""
@@ -144,20 +298,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     
     logger.info(f"Received /start command from user {user_id}")
     
-    if user_id not in user_contexts:
-        user_contexts[user_id] = Context(telegram=update.effective_user)
-    
-    current_context = user_contexts[user_id]
+    current_context = _ctx(user_id, update.effective_user)
     
     # Show simplified dialog options - only 2 buttons
     message = "Добро пожаловать в KingSpeech! 🎓\n\nВыберите, что вы хотите сделать:"
-    keyboard = [
-        [InlineKeyboardButton("Начать учиться с King Speech", callback_data="start_branch|main_survey")],
-        [InlineKeyboardButton("Пройти тест на знание языка", callback_data="start_branch|quick_test")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(message, reply_markup=reply_markup)
+    await update.message.reply_text(message, reply_markup=_START_MARKUP)
 
 @retry_on_error()
 @safe_execute
@@ -191,6 +336,7 @@ async def trash_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "Отправьте /start, чтобы начать новый диалог."
     )
 
+@per_user
 @retry_on_error()
 @safe_execute
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -213,11 +359,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     logger.info(f"Received message from user {user_id}: {update.message.text}")
     
     # Create or get user context
-    if user_id not in user_contexts:
-        logger.info(f"Creating new context for user {user_id}")
-        user_contexts[user_id] = Context(telegram=update.effective_user)
-    
-    current_context = user_contexts[user_id]
+    current_context = _ctx(user_id, update.effective_user)
     
     # Handle contact sharing
     if hasattr(update.message, 'contact') and update.message.contact:
@@ -228,8 +370,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     # Check for manual phone input
     user_message = update.message.text or ""
-    phone_pattern = r"^(\+7|8)\d{10}$"
-    if re.match(phone_pattern, user_message):
+    if PHONE_RE.match(user_message):
         lang = current_context.get_variable('interface_lang', 'ru')
         if lang == 'en':
             await update.message.reply_text(
@@ -241,8 +382,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
         return
     
-    # Get active dialog branch
-    active_branch = dialog_manager.get_active_branch(str(user_id))
+    # Get active dialog branch (dialog_manager хранит id строками - переводим один раз)
+    uid = str(user_id)
+    active_branch = dialog_manager.get_active_branch(uid)
     if not active_branch:
         # No active branch, show start options
         await start_command(update, context)
@@ -261,90 +403,112 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await send_step_message(update, context, step)
         else:
             # Branch completed, end it
-            dialog_manager.end_branch(str(user_id))
+            dialog_manager.end_branch(uid)
             await update.message.reply_text("Диалог завершен. Используйте /start для нового диалога.")
     except Exception as e:
-        logger.error(f"Error processing message: {e}", exc_info=True)
+        log_error("Error processing message", e)
         await update.message.reply_text("Произошла ошибка. Пожалуйста, начните сначала с команды /start")
 
+def with_user_ctx(handler: Callable) -> Callable:
+    """Декоратор для обработчиков callback: лимит нажатий, ответ на запрос и контекст пользователя"""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user_id = update.effective_user.id
+        
+        # Rate limiting check for callbacks
+        if not callback_rate_limiter.is_allowed(user_id):
+            cooldown_remaining = callback_rate_limiter.get_cooldown_remaining(user_id)
+            if cooldown_remaining > 0:
+                await update.callback_query.answer(
+                    f"Слишком много нажатий. Подождите {cooldown_remaining} секунд.",
+                    show_alert=True
+                )
+            else:
+                await update.callback_query.answer(
+                    "Слишком много нажатий. Пожалуйста, подождите немного.",
+                    show_alert=True
+                )
+            return
+        
+        logger.info(f"Received callback from user {user_id}: {update.callback_query.data}")
+        await update.callback_query.answer()
+        await handler(update, context, _ctx(user_id, update.effective_user))
+    return wrapper
+
+@per_user
 @retry_on_error()
 @safe_execute
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle callback queries"""
-    user_id = update.effective_user.id
-    
-    # Rate limiting check for callbacks
-    if not callback_rate_limiter.is_allowed(user_id):
-        cooldown_remaining = callback_rate_limiter.get_cooldown_remaining(user_id)
-        if cooldown_remaining > 0:
-            await update.callback_query.answer(
-                f"Слишком много нажатий. Подождите {cooldown_remaining} секунд.",
-                show_alert=True
-            )
-        else:
-            await update.callback_query.answer(
-                "Слишком много нажатий. Пожалуйста, подождите немного.",
-                show_alert=True
-            )
-        return
-    
-    logger.info(f"Received callback from user {user_id}: {update.callback_query.data}")
+@with_user_ctx
+async def start_branch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, current_context: Context) -> None:
+    """Start a specific dialog branch (start_branch|<name>)"""
+    branch_name = update.callback_query.data.split("|")[1]
+    step = dialog_manager.start_branch(str(update.effective_user.id), branch_name, current_context)
+    if step:
+        await send_step_message(update, context, step)
+    else:
+        await update.callback_query.message.reply_text("Произошла ошибка при запуске диалога.")
+
+@per_user
+@retry_on_error()
+@safe_execute
+@with_user_ctx
+async def start_main_survey_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, current_context: Context) -> None:
+    """Start main survey"""
+    step = dialog_manager.start_branch(str(update.effective_user.id), "main_survey", current_context)
+    if step:
+        await send_step_message(update, context, step)
+
+@per_user
+@retry_on_error()
+@safe_execute
+@with_user_ctx
+async def retake_test_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, current_context: Context) -> None:
+    """Reset and retake test"""
+    user_id = str(update.effective_user.id)
+    dialog_manager.end_branch(user_id)
+    step = dialog_manager.start_branch(user_id, "quick_test", current_context)
+    if step:
+        await send_step_message(update, context, step)
+
+@per_user
+@retry_on_error()
+@safe_execute
+@with_user_ctx
+async def status_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, current_context: Context) -> None:
+    """Handle status updates from the manager chat (status|<telegram_id>|<reg_time>|<status>)"""
     query = update.callback_query
-    await query.answer()
-    if user_id not in user_contexts:
-        user_contexts[user_id] = Context(telegram=update.effective_user)
-    
-    current_context = user_contexts[user_id]
-    
-    # Handle special callback data
-    if query.data.startswith("start_branch|"):
-        # Start a specific dialog branch
-        branch_name = query.data.split("|")[1]
-        step = dialog_manager.start_branch(str(user_id), branch_name, current_context)
-        if step:
-            await send_step_message(update, context, step)
-        else:
-            await query.message.reply_text("Произошла ошибка при запуске диалога.")
-        return
-    
-    elif query.data == "start_main_survey":
-        # Start main survey
-        step = dialog_manager.start_branch(str(user_id), "main_survey", current_context)
-        if step:
-            await send_step_message(update, context, step)
-        return
-    
-    elif query.data == "retake_test":
-        # Reset and retake test
-        dialog_manager.end_branch(str(user_id))
-        step = dialog_manager.start_branch(str(user_id), "quick_test", current_context)
-        if step:
-            await send_step_message(update, context, step)
-        return
-    
-    # Handle status updates (existing functionality)
-    if query.data.startswith("status|"):
-        try:
-            _, telegram_id, reg_time, new_status = query.data.split("|", 3)
-            # Update status in Google Sheets
-            if sheet:
-                month_sheet = get_month_sheet_name()
-                sheet.get_or_create_sheet(month_sheet)
-                current_status = sheet.get_status(telegram_id, reg_time)
-                if current_status in ["В работе", "Обработано"]:
-                    await query.edit_message_reply_markup(reply_markup=None)
-                    await query.message.reply_text(f"Статус уже обновлён: {current_status}")
-                    return
-                sheet.update_status(telegram_id, reg_time, new_status)
+    try:
+        _, telegram_id, reg_time, new_status = query.data.split("|", 3)
+        # Update status in Google Sheets
+        if sheet:
+            key = (telegram_id, reg_time)
+            sheet_name = get_month_sheet_name()
+            current_status = known_statuses.get(key)
+            if current_status is None:
+                # Блокирующие вызовы Sheets API выполняются в пуле потоков, не останавливая event loop
+                current_status = await asyncio.to_thread(read_status, sheet_name, telegram_id, reg_time)
+            if current_status in FINAL_STATUSES:
                 await query.edit_message_reply_markup(reply_markup=None)
-                await query.message.reply_text(f"Статус заявки обновлён: {new_status}")
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении статуса: {e}", exc_info=True)
-            await query.message.reply_text(f"Ошибка при обновлении статуса: {e}")
-        return
-    
-    # Handle regular dialog callbacks
-    active_branch = dialog_manager.get_active_branch(str(user_id))
+                await query.message.reply_text(f"Статус уже обновлён: {current_status}")
+                return
+            # Запись уходит в write-behind очередь и попадает в таблицу общим batchUpdate
+            known_statuses[key] = new_status
+            await status_queue.put((telegram_id, reg_time, new_status, sheet_name))
+            await query.edit_message_reply_markup(reply_markup=None)
+            await query.message.reply_text(f"Статус заявки обновлён: {new_status}")
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении статуса: {e}", exc_info=True)
+        await query.message.reply_text(f"Ошибка при обновлении статуса: {e}")
+
+@per_user
+@retry_on_error()
+@safe_execute
+@with_user_ctx
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, current_context: Context) -> None:
+    """Handle regular dialog callbacks (everything not matched by the routes above)"""
+    user_id = str(update.effective_user.id)
+    query = update.callback_query
+    active_branch = dialog_manager.get_active_branch(user_id)
     if active_branch:
         branch = dialog_manager.get_branch(active_branch)
         if branch:
@@ -358,10 +522,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     await send_step_message(update, context, step)
                 else:
                     # Branch completed
-                    dialog_manager.end_branch(str(user_id))
+                    dialog_manager.end_branch(user_id)
                     await query.message.reply_text("Диалог завершен. Используйте /start для нового диалога.")
             except Exception as e:
-                logger.error(f"Error processing callback: {e}", exc_info=True)
+                log_error("Error processing callback", e)
                 await query.message.reply_text("Произошла ошибка. Пожалуйста, начните сначала с команды /start")
 
 @retry_on_error()
@@ -382,10 +546,7 @@ async def send_step_message(update: Update, context: ContextTypes.DEFAULT_TYPE,
             
         if getattr(update, "callback_query", None):
             if step.options and not reply_markup:
-                keyboard = []
-                for option in step.options:
-                    keyboard.append([InlineKeyboardButton(option, callback_data=option)])
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _inline_markup(step.options)
             try:
                 await update.callback_query.edit_message_text(text=step.message, reply_markup=reply_markup)
             except telegram.error.BadRequest as e:
@@ -395,10 +556,7 @@ async def send_step_message(update: Update, context: ContextTypes.DEFAULT_TYPE,
                     await update.callback_query.message.reply_text(text=step.message, reply_markup=reply_markup)
         else:
             if step.options and not reply_markup:
-                keyboard = []
-                for option in step.options:
-                    keyboard.append([InlineKeyboardButton(option, callback_data=option)])
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _inline_markup(step.options)
                 await update.message.reply_text(text=step.message, reply_markup=reply_markup)
             elif reply_markup:
                 await update.message.reply_text(text=step.message, reply_markup=reply_markup)
@@ -406,7 +564,7 @@ async def send_step_message(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 await update.message.reply_text(text=step.message)
                 
     except Exception as e:
-        logger.error(f"Error in send_step_message: {e}", exc_info=True)
+        log_error("Error in send_step_message", e)
         # Fallback: try to send simple text message
         try:
             if getattr(update, "message", None):
@@ -416,24 +574,159 @@ async def send_step_message(update: Update, context: ContextTypes.DEFAULT_TYPE,
         except:
             logger.error("Failed to send error message to user")
 
+# (момент monotonic, до которого значение актуально, имя листа)
+_month_sheet_cache = (0.0, "")
+MONTH_SHEET_CACHE_TTL = 60.0
+
 def get_month_sheet_name():
-    """Get current month sheet name"""
-    months = [
-        "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
-        "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
-    ]
-    now = datetime.datetime.now()
-    return months[now.month - 1]
+    """Get current month sheet name (re-checked at most once a minute)"""
+    global _month_sheet_cache
+    now = time.monotonic()
+    valid_until, name = _month_sheet_cache
+    if now < valid_until:
+        return name
+    name = MONTH_SHEET_NAMES[datetime.datetime.now().month - 1]
+    _month_sheet_cache = (now + MONTH_SHEET_CACHE_TTL, name)
+    return name
+
+def read_status(sheet_name: str, telegram_id: str, reg_time: str) -> Optional[str]:
+    """Read a lead's status from Google Sheets (blocking, run via asyncio.to_thread)"""
+    with _sheet_lock:
+        sheet.get_or_create_sheet(sheet_name)
+        return sheet.get_status(telegram_id, reg_time)
+
+def write_statuses(batch) -> list:
+    """Write queued status updates with one read and one batchUpdate per sheet (blocking, run via asyncio.to_thread).
+    Returns the updates whose lead was not found"""
+    by_sheet: Dict[str, list] = {}
+    for telegram_id, reg_time, new_status, sheet_name in batch:
+        by_sheet.setdefault(sheet_name, []).append((telegram_id, reg_time, new_status))
+    missing = []
+    with _sheet_lock:
+        for sheet_name, updates in by_sheet.items():
+            sheet.sheet_name = sheet_name
+            missing.extend((*update, sheet_name) for update in sheet.update_statuses(updates))
+    return missing
+
+async def notify_manager(text: str) -> None:
+    """Send a service message to the manager chat"""
+    try:
+        await application.bot.send_message(chat_id=MANAGER_CHAT_ID, text=text)
+    except Exception as e:
+        logger.error(f"Failed to notify manager chat: {e}")
+
+def _format_updates(batch) -> str:
+    return "\n".join(
+        f"{sheet_name}: {telegram_id} | {reg_time} -> {new_status}"
+        for telegram_id, reg_time, new_status, sheet_name in batch
+    )
+
+async def write_status_batch(batch) -> None:
+    """Write a status batch, retrying on errors; the manager chat hears about anything not written"""
+    for attempt in range(1, STATUS_WRITE_ATTEMPTS + 1):
+        try:
+            missing = await asyncio.to_thread(write_statuses, batch)
+            logger.info(f"Status batch written: {len(batch) - len(missing)} update(s)")
+            break
+        except Exception as e:
+            logger.error(f"Failed to write status batch (attempt {attempt}/{STATUS_WRITE_ATTEMPTS}): {e}", exc_info=True)
+            if attempt < STATUS_WRITE_ATTEMPTS:
+                await asyncio.sleep(STATUS_RETRY_DELAY * attempt)
+    else:
+        missing = batch
+    if missing:
+        # Следующая проверка статуса перечитает таблицу
+        for telegram_id, reg_time, _, _ in missing:
+            known_statuses.pop((telegram_id, reg_time), None)
+        await notify_manager(f"⚠️ Статус не записан в таблицу, обновите вручную:\n{_format_updates(missing)}")
+
+async def status_writer() -> None:
+    """Write-behind: collect status updates for STATUS_FLUSH_INTERVAL and send them in one batch"""
+    while True:
+        batch = [await status_queue.get()]
+        try:
+            await asyncio.sleep(STATUS_FLUSH_INTERVAL)
+        except asyncio.CancelledError:
+            status_queue.put_nowait(batch[0])  # допишется в _post_stop
+            raise
+        while not status_queue.empty() and len(batch) < STATUS_BATCH_MAX:
+            batch.append(status_queue.get_nowait())
+        try:
+            await write_status_batch(batch)
+        except asyncio.CancelledError:
+            # Недописанная пачка вернётся в очередь и допишется в _post_stop
+            for item in batch:
+                status_queue.put_nowait(item)
+            raise
+
+async def _post_init(app: Application) -> None:
+    """Bound the default executor used by asyncio.to_thread and start the status writer"""
+    global _status_writer_task
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    )
+    _status_writer_task = asyncio.create_task(status_writer())
+
+async def _post_stop(app: Application) -> None:
+    """Stop the status writer and write whatever is still queued"""
+    if _status_writer_task is not None:
+        _status_writer_task.cancel()
+        try:
+            await _status_writer_task
+        except asyncio.CancelledError:
+            pass
+    batch = []
+    while not status_queue.empty():
+        batch.append(status_queue.get_nowait())
+    if batch and sheet:
+        await write_status_batch(batch)
+
+async def _post_shutdown(app: Application) -> None:
+    """Close the shared OpenRouter HTTP client if the AI tutor was loaded"""
+    # Модуль импортируем только если он уже загружен: без OpenRouter закрывать нечего
+    ai_tutor = sys.modules.get("services.ai_tutor_service")
+    if ai_tutor is not None:
+        await ai_tutor.close_client()
 
 def setup_application() -> Application:
     """Setup application with error handling"""
     try:
-        app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # Отдельные пулы: long polling getUpdates не занимает соединения для отправки ответов
+        request = HTTPXRequest(
+            connection_pool_size=64,
+            http_version=HTTP_VERSION,
+            connect_timeout=10.0,
+            read_timeout=30.0,
+            write_timeout=30.0,
+        )
+        get_updates_request = HTTPXRequest(connection_pool_size=8, http_version=HTTP_VERSION)
+        builder = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .request(request)
+            .get_updates_request(get_updates_request)
+            .concurrent_updates(True)
+            .post_init(_post_init)
+            .post_stop(_post_stop)
+            .post_shutdown(_post_shutdown)
+        )
+        if find_spec("aiolimiter") is not None:
+            # Очередь исходящих запросов в пределах лимитов Telegram (30/с на бота, 1/с на чат);
+            # на RetryAfter лимитер сам ждёт и повторяет запрос
+            builder = builder.rate_limiter(
+                AIORateLimiter(overall_max_rate=30, overall_time_period=1, max_retries=3)
+            )
+        app = builder.build()
         
         # Register handlers
         app.add_handler(CommandHandler("start", start_command))
         app.add_handler(CommandHandler("help", help_command))
         app.add_handler(CommandHandler("trash", trash_command))
+        # Маршрутизация callback по шаблонам; общий обработчик диалогов - последним
+        app.add_handler(CallbackQueryHandler(start_branch_callback, pattern=r"^start_branch\|"))
+        app.add_handler(CallbackQueryHandler(start_main_survey_callback, pattern=r"^start_main_survey$"))
+        app.add_handler(CallbackQueryHandler(retake_test_callback, pattern=r"^retake_test$"))
+        app.add_handler(CallbackQueryHandler(status_callback, pattern=r"^status\|"))
         app.add_handler(CallbackQueryHandler(handle_callback))
         app.add_handler(MessageHandler(filters.TEXT | filters.CONTACT, handle_message))
         
@@ -443,18 +736,6 @@ def setup_application() -> Application:
         logger.error(f"Failed to setup application: {e}")
         raise
 
-async def cleanup_rate_limiter():
-    """Periodic cleanup of rate limiter data"""
-    while True:
-        try:
-            await asyncio.sleep(300)  # Cleanup every 5 minutes
-            message_rate_limiter.cleanup_old_data()
-            callback_rate_limiter.cleanup_old_data()
-            command_rate_limiter.cleanup_old_data()
-            logger.debug("Rate limiter cleanup completed")
-        except Exception as e:
-            logger.error(f"Error in rate limiter cleanup: {e}")
-
 async def main():
     """Main function with error handling"""
     global application
@@ -1,9 +1,21 @@
 import os
-import requests
-import json
+import time
+from importlib.util import find_spec
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
-load_dotenv()
+try:
+    import orjson
+except ImportError:  # orjson быстрее разбирает ответы модели, но не обязателен
+    import json as orjson
+
+# .env читаем один раз на процесс (тот же флаг, что и в config.py)
+if not os.environ.get("_KS_ENV_LOADED"):
+    load_dotenv()
+    os.environ["_KS_ENV_LOADED"] = "1"
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 API_URL = "https://openrouter.ai/api/v1/chat/completions"
@@ -15,29 +27,96 @@ headers = {
 }
 
 # Загружаем параметры тьютора
-with open("tutor_config.json", encoding="utf-8") as f:
-    TUTOR_CONFIG = json.load(f)
+with open("tutor_config.json", "rb") as f:
+    TUTOR_CONFIG = orjson.loads(f.read())
 
 SYSTEM_PROMPT = TUTOR_CONFIG.get("system_prompt", "")
 MAX_TOKENS = TUTOR_CONFIG.get("max_tokens", 256)
 TEMPERATURE = TUTOR_CONFIG.get("temperature", 0.7)
 MODEL = "mistralai/mistral-7b-instruct"  # Можно выбрать любую поддерживаемую модель
+# Неизменяемые части запроса собираются один раз
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+_BASE_PAYLOAD = {"model": MODEL, "max_tokens": MAX_TOKENS, "temperature": TEMPERATURE}
+# Ответы на одинаковые запросы (prompt, max_tokens, temperature) берутся из кэша
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 3600
+MAX_CACHED_TEMPERATURE = 0.9  # Ответы с более высокой температурой должны различаться - не кэшируем
+_response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+STREAM_EDIT_INTERVAL = 1.0  # Не чаще одного редактирования сообщения в секунду (лимит Telegram на чат)
+
+# Общий клиент: keep-alive соединения переиспользуются между запросами (HTTP/2, если установлен h2)
+_client = httpx.AsyncClient(
+    http2=find_spec("h2") is not None,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    headers=headers,
+    timeout=60,
+)
+
+def _payload(prompt: str, max_tokens: int = None, temperature: float = None) -> dict:
+    """Тело запроса: копия шаблона с сообщением пользователя и переопределёнными параметрами"""
+    # Ключ проверяем при запросе, чтобы импорт модуля работал и без него (тесты, CI)
+    if not OPENROUTER_API_KEY:
+        raise ValueError("OPENROUTER_API_KEY не установлен в переменных окружения")
+    payload = {**_BASE_PAYLOAD, "messages": [_SYSTEM_MSG, {"role": "user", "content": prompt}]}
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    if temperature is not None:
+        payload["temperature"] = temperature
+    return payload
 
-def ask_openrouter(prompt: str, max_tokens: int = None, temperature: float = None) -> str:
-    if max_tokens is None:
-        max_tokens = MAX_TOKENS
-    if temperature is None:
-        temperature = TEMPERATURE
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": max_tokens,
-        "temperature": temperature
-    }
-    response = requests.post(API_URL, headers=headers, json=payload, timeout=60)
+async def ask_openrouter(prompt: str, max_tokens: int = None, temperature: float = None) -> str:
+    payload = _payload(prompt, max_tokens, temperature)
+    cacheable = payload["temperature"] <= MAX_CACHED_TEMPERATURE
+    key = (prompt, payload["max_tokens"], payload["temperature"])
+    if cacheable:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            return cached
+    # Тело сериализуем сами: Content-Type уже задан в заголовках клиента
+    response = await _client.post(API_URL, content=orjson.dumps(payload))
     response.raise_for_status()
-    result = response.json()
-    return result["choices"][0]["message"]["content"] 
\ No newline at end of file
+    result = orjson.loads(response.content)
+    content = result["choices"][0]["message"]["content"]
+    if cacheable:
+        _response_cache[key] = content
+    return content
+
+async def stream_openrouter(prompt: str, max_tokens: int = None, temperature: float = None) -> AsyncIterator[str]:
+    """Ответ модели по частям (SSE, stream=true) - первые токены приходят, не дожидаясь конца генерации"""
+    payload = _payload(prompt, max_tokens, temperature)
+    payload["stream"] = True
+    async with _client.stream("POST", API_URL, content=orjson.dumps(payload)) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            # Пропускаем пустые строки и комментарии keep-alive (": OPENROUTER PROCESSING")
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            chunk = orjson.loads(data)
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                yield content
+
+async def stream_reply(prompt: str, edit: Callable[[str], Awaitable[None]],
+                       interval: float = STREAM_EDIT_INTERVAL, **kwargs) -> str:
+    """Накапливает потоковый ответ и передаёт текст в edit (например, edit_message_text) не чаще interval секунд"""
+    parts = []
+    shown = ""
+    last_edit = time.monotonic()
+    async for content in stream_openrouter(prompt, **kwargs):
+        parts.append(content)
+        now = time.monotonic()
+        if now - last_edit >= interval:
+            shown = "".join(parts)
+            await edit(shown)
+            last_edit = now
+    text = "".join(parts)
+    if text and text != shown:
+        await edit(text)
+    return text
+
+async def close_client() -> None:
+    """Закрывает общий HTTP-клиент (вызывать при остановке приложения, например из post_shutdown)"""
+    await _client.aclose() 
\ No newline at end of file
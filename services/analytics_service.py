@@ -6,11 +6,27 @@ Handles funnel tracking and conversion analytics
 import json
 import os
 import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dataclasses import dataclass, asdict
 from services.settings_service import settings
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json writes the same lines, only slower
+    orjson = None
+
+
+def _dumps_line(obj: Dict) -> bytes:
+    """Serialize one event as a JSONL line"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
 
 @dataclass
 class AnalyticsEvent:
@@ -27,35 +43,227 @@ class AnalyticsEvent:
     schedule: str = ""
 
 
+# String fields stored as integer codes in their own columns
+CODED_FIELDS = ("event_type", "user_id", "session_id", "goal", "level", "format_pref", "schedule")
+
+
+class _Codes:
+    """Interns the values of one string column as small integer codes"""
+    __slots__ = ("index", "values")
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value: str) -> int:
+        """Code for value, assigning the next free one on first sight"""
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+# Event types counted per session: contacts, materials, trials
+COUNTED_TYPES = {"contact_submitted": 0, "material_delivered": 1, "trial_booked": 2}
+
+
+class SessionAgg:
+    """Running totals of one session, updated as its events arrive"""
+    __slots__ = ("last_ts", "max_step", "raised", "counts", "goals", "levels")
+
+    def __init__(self):
+        self.last_ts = 0.0
+        self.max_step = 0
+        self.raised: List[int] = []  # steps that raised max_step, in order
+        self.counts = [0, 0, 0]
+        self.goals: Dict[int, List[int]] = {}  # goal code -> counts of events with that goal
+        self.levels: Dict[int, List[int]] = {}
+
+
 class AnalyticsService:
-    """Service for analytics and funnel tracking"""
+    """Service for analytics and funnel tracking
     
-    def __init__(self, events_file: str = "analytics_events.json"):
+    Events are stored column-wise (timestamps, funnel steps and coded string
+    fields in typed arrays, kept in time order). Report queries don't scan
+    events at all: track_event keeps running per-session totals, ordered by
+    last activity, and a report walks only the sessions active in its period.
+    A session active in the period is reported with all of its events.
+    """
+    
+    def __init__(self, events_file: str = "analytics_events.jsonl", flush_interval: float = 0.0):
         self.events_file = events_file
-        self.events: List[AnalyticsEvent] = []
+        # Events are appended to an open JSONL log; 0 flushes after every event
+        self.flush_interval = flush_interval
+        self._fp = None
+        self._last_flush = 0.0
+        self._batch_depth = 0
+        self._reset_columns()
         self.load_events()
     
-    def load_events(self) -> None:
-        """Load events from JSON file"""
-        if os.path.exists(self.events_file):
-            try:
-                with open(self.events_file, 'r', encoding='utf-8') as f:
-                    events_data = json.load(f)
-                    self.events = [AnalyticsEvent(**event) for event in events_data]
-            except Exception as e:
-                print(f"Error loading events: {e}")
-                self.events = []
+    def _reset_columns(self) -> None:
+        self._timestamps = array("d")
+        self._steps = array("b")
+        self._cols = {name: array("l") for name in CODED_FIELDS}
+        self._codes = {name: _Codes() for name in CODED_FIELDS}
+        self._data: List[Dict] = []
+        self._sessions: "OrderedDict[int, SessionAgg]" = OrderedDict()
+    
+    def _append(self, event: AnalyticsEvent) -> None:
+        """Append an event to the columns"""
+        self._timestamps.append(event.timestamp)
+        self._steps.append(event.funnel_step)
+        for name in CODED_FIELDS:
+            self._cols[name].append(self._codes[name].code(getattr(event, name)))
+        self._data.append(event.data)
+        self._aggregate(len(self._timestamps) - 1)
+    
+    def _aggregate(self, i: int) -> None:
+        """Fold the i-th event into its session's running totals"""
+        cols = self._cols
+        session = cols["session_id"][i]
+        agg = self._sessions.get(session)
+        if agg is None:
+            agg = self._sessions[session] = SessionAgg()
         else:
-            self.events = []
+            self._sessions.move_to_end(session)
+        agg.last_ts = self._timestamps[i]
+        
+        step = self._steps[i]
+        if step > agg.max_step:
+            agg.max_step = step
+            agg.raised.append(step)
+        
+        kind = COUNTED_TYPES.get(self._codes["event_type"].values[cols["event_type"][i]])
+        if kind is not None:
+            agg.counts[kind] += 1
+        for field, groups in (("goal", agg.goals), ("level", agg.levels)):
+            value = cols[field][i]
+            if not self._codes[field].values[value]:
+                continue
+            counts = groups.get(value)
+            if counts is None:
+                counts = groups[value] = [0, 0, 0]
+            if kind is not None:
+                counts[kind] += 1
+    
+    def _recent_sessions(self, days: int) -> List[SessionAgg]:
+        """Sessions with activity in the last days (most recent first)"""
+        cutoff_time = time.time() - (days * 24 * 60 * 60)
+        recent = []
+        for agg in reversed(self._sessions.values()):
+            if agg.last_ts < cutoff_time:
+                break
+            recent.append(agg)
+        return recent
+    
+    def _event(self, i: int) -> AnalyticsEvent:
+        """Rebuild the i-th event from the columns"""
+        fields = {name: self._codes[name].values[self._cols[name][i]] for name in CODED_FIELDS}
+        return AnalyticsEvent(timestamp=self._timestamps[i], data=self._data[i],
+                              funnel_step=self._steps[i], **fields)
+    
+    @property
+    def events(self) -> List[AnalyticsEvent]:
+        """All events in time order"""
+        return [self._event(i) for i in range(len(self._timestamps))]
+    
+    def _indices(self, name: str, value: str) -> List[int]:
+        """Positions of events whose coded field equals value"""
+        code = self._codes[name].index.get(value)
+        if code is None:
+            return []
+        return [i for i, c in enumerate(self._cols[name]) if c == code]
+    
+    def load_events(self) -> None:
+        """Load events from the JSONL log
+        
+        A legacy JSON array file - events_file itself, or the old .json file
+        next to a .jsonl log that doesn't exist yet - is loaded and rewritten
+        as the JSONL log.
+        """
+        self._reset_columns()
+        source = self.events_file
+        if not os.path.exists(source):
+            source = os.path.splitext(self.events_file)[0] + ".json"
+            if source == self.events_file or not os.path.exists(source):
+                return
+        try:
+            with open(source, 'rb') as f:
+                raw = f.read()
+            legacy = raw.lstrip().startswith(b"[")
+            if legacy:
+                events_data = json.loads(raw)
+            else:
+                events_data = []
+                for line in raw.splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        events_data.append(json.loads(line))
+                    except ValueError:
+                        # A line cut short by a crash mid-write
+                        print(f"Skipping malformed analytics event line: {line[:80]!r}")
+            events = [AnalyticsEvent(**event) for event in events_data]
+            # Columns are kept in time order
+            events.sort(key=lambda e: e.timestamp)
+            for event in events:
+                self._append(event)
+        except Exception as e:
+            print(f"Error loading events: {e}")
+            self._reset_columns()
+            return
+        if legacy or source != self.events_file:
+            print(f"Migrating analytics events from {source} to {self.events_file}")
+            self.compact()
+    
+    def _write(self, event: AnalyticsEvent) -> None:
+        """Append one event to the log, flushing per flush_interval unless inside batch()"""
+        try:
+            if self._fp is None:
+                self._fp = open(self.events_file, 'ab', buffering=1 << 16)
+            self._fp.write(_dumps_line(asdict(event)))
+            if not self._batch_depth:
+                now = time.monotonic()
+                if now - self._last_flush >= self.flush_interval:
+                    self.flush()
+                    self._last_flush = now
+        except Exception as e:
+            print(f"Error saving event: {e}")
     
-    def save_events(self) -> None:
-        """Save events to JSON file"""
+    def flush(self) -> None:
+        """Push buffered log lines to the file"""
+        if self._fp is not None:
+            self._fp.flush()
+    
+    def close(self) -> None:
+        """Flush and close the log file"""
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+    
+    @contextmanager
+    def batch(self):
+        """Defer log flushes for bulk ingest until the block exits"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+    
+    def compact(self) -> None:
+        """Rewrite the log with only the events currently held"""
+        self.close()
+        tmp_file = f"{self.events_file}.tmp"
         try:
-            events_data = [asdict(event) for event in self.events]
-            with open(self.events_file, 'w', encoding='utf-8') as f:
-                json.dump(events_data, f, ensure_ascii=False, indent=2)
+            with open(tmp_file, 'wb') as f:
+                for event in self.events:
+                    f.write(_dumps_line(asdict(event)))
+            os.replace(tmp_file, self.events_file)
         except Exception as e:
-            print(f"Error saving events: {e}")
+            print(f"Error compacting events: {e}")
     
     def track_event(self, event_type: str, user_id: str, session_id: str, 
                    data: Dict = None, funnel_step: int = 0, goal: str = "", 
@@ -74,20 +282,12 @@ class AnalyticsService:
             schedule=schedule
         )
         
-        self.events.append(event)
-        self.save_events()
+        self._append(event)
+        self._write(event)
     
     def get_funnel_analytics(self, days: int = 30) -> Dict:
         """Get funnel analytics for the specified period"""
-        cutoff_time = time.time() - (days * 24 * 60 * 60)
-        recent_events = [e for e in self.events if e.timestamp >= cutoff_time]
-        
-        # Group events by session
-        sessions = {}
-        for event in recent_events:
-            if event.session_id not in sessions:
-                sessions[event.session_id] = []
-            sessions[event.session_id].append(event)
+        sessions = self._recent_sessions(days)
         
         # Calculate funnel metrics
         funnel_steps = {
@@ -106,27 +306,17 @@ class AnalyticsService:
         material_downloads = 0
         trial_bookings = 0
         
-        for session_events in sessions.values():
-            # Sort events by timestamp
-            session_events.sort(key=lambda x: x.timestamp)
-            
-            # Track funnel progress
-            max_step = 0
-            for event in session_events:
-                if event.funnel_step > max_step:
-                    max_step = event.funnel_step
-                    funnel_steps[event.funnel_step] += 1
-                
-                # Track specific events
-                if event.event_type == "contact_submitted":
-                    contact_submissions += 1
-                elif event.event_type == "material_delivered":
-                    material_downloads += 1
-                elif event.event_type == "trial_booked":
-                    trial_bookings += 1
+        for agg in sessions:
+            # A step is counted when it raised the session's maximum
+            for step in agg.raised:
+                funnel_steps[step] += 1
+            contacts, materials, trials = agg.counts
+            contact_submissions += contacts
+            material_downloads += materials
+            trial_bookings += trials
             
             # Check if session completed
-            if max_step >= 8:
+            if agg.max_step >= 8:
                 completed_sessions += 1
         
         total_sessions = len(sessions)
@@ -149,18 +339,14 @@ class AnalyticsService:
     
     def get_user_journey(self, user_id: str) -> List[AnalyticsEvent]:
         """Get complete user journey"""
-        user_events = [e for e in self.events if e.user_id == user_id]
-        user_events.sort(key=lambda x: x.timestamp)
-        return user_events
+        return [self._event(i) for i in self._indices("user_id", user_id)]
     
     def get_session_analytics(self, session_id: str) -> Dict:
         """Get analytics for specific session"""
-        session_events = [e for e in self.events if e.session_id == session_id]
-        session_events.sort(key=lambda x: x.timestamp)
+        session_events = [self._event(i) for i in self._indices("session_id", session_id)]
         
         if not session_events:
             return {}
-        
         start_time = session_events[0].timestamp
         end_time = session_events[-1].timestamp
         duration = end_time - start_time
@@ -176,89 +362,42 @@ class AnalyticsService:
             "events": [asdict(e) for e in session_events]
         }
     
+    def _group_analytics(self, field: str, days: int) -> Dict:
+        """Session counts and contact/material/trial counts grouped by goal or level"""
+        groups: Dict[int, Dict] = {}
+        for agg in self._recent_sessions(days):
+            for value, (contacts, materials, trials) in getattr(agg, f"{field}s").items():
+                group = groups.get(value)
+                if group is None:
+                    group = groups[value] = {"contacts": 0, "materials": 0, "trials": 0, "session_count": 0}
+                group["contacts"] += contacts
+                group["materials"] += materials
+                group["trials"] += trials
+                group["session_count"] += 1
+        
+        # Convert codes back to values
+        values = self._codes[field].values
+        return {values[value]: group for value, group in groups.items()}
+    
     def get_goal_analytics(self, days: int = 30) -> Dict:
         """Get analytics by user goals"""
-        cutoff_time = time.time() - (days * 24 * 60 * 60)
-        recent_events = [e for e in self.events if e.timestamp >= cutoff_time]
-        
-        goals = {}
-        for event in recent_events:
-            if event.goal:
-                if event.goal not in goals:
-                    goals[event.goal] = {
-                        "sessions": set(),
-                        "contacts": 0,
-                        "materials": 0,
-                        "trials": 0
-                    }
-                
-                goals[event.goal]["sessions"].add(event.session_id)
-                
-                if event.event_type == "contact_submitted":
-                    goals[event.goal]["contacts"] += 1
-                elif event.event_type == "material_delivered":
-                    goals[event.goal]["materials"] += 1
-                elif event.event_type == "trial_booked":
-                    goals[event.goal]["trials"] += 1
-        
-        # Convert sets to counts
-        for goal in goals:
-            goals[goal]["session_count"] = len(goals[goal]["sessions"])
-            del goals[goal]["sessions"]
-        
-        return goals
+        return self._group_analytics("goal", days)
     
     def get_level_analytics(self, days: int = 30) -> Dict:
         """Get analytics by user levels"""
-        cutoff_time = time.time() - (days * 24 * 60 * 60)
-        recent_events = [e for e in self.events if e.timestamp >= cutoff_time]
-        
-        levels = {}
-        for event in recent_events:
-            if event.level:
-                if event.level not in levels:
-                    levels[event.level] = {
-                        "sessions": set(),
-                        "contacts": 0,
-                        "materials": 0,
-                        "trials": 0
-                    }
-                
-                levels[event.level]["sessions"].add(event.session_id)
-                
-                if event.event_type == "contact_submitted":
-                    levels[event.level]["contacts"] += 1
-                elif event.event_type == "material_delivered":
-                    levels[event.level]["materials"] += 1
-                elif event.event_type == "trial_booked":
-                    levels[event.level]["trials"] += 1
-        
-        # Convert sets to counts
-        for level in levels:
-            levels[level]["session_count"] = len(levels[level]["sessions"])
-            del levels[level]["sessions"]
-        
-        return levels
+        return self._group_analytics("level", days)
     
     def get_dropoff_points(self, days: int = 30) -> Dict:
         """Identify funnel dropoff points"""
-        cutoff_time = time.time() - (days * 24 * 60 * 60)
-        recent_events = [e for e in self.events if e.timestamp >= cutoff_time]
-        
-        # Group by session and find max step reached
-        sessions = {}
-        for event in recent_events:
-            if event.session_id not in sessions:
-                sessions[event.session_id] = 0
-            sessions[event.session_id] = max(sessions[event.session_id], event.funnel_step)
+        sessions = self._recent_sessions(days)
         
         # Count dropoffs at each step
         dropoffs = {i: 0 for i in range(1, 9)}
         total_sessions = len(sessions)
         
-        for max_step in sessions.values():
-            if max_step < 8:  # Session didn't complete
-                dropoffs[max_step] += 1
+        for agg in sessions:
+            if 0 < agg.max_step < 8:  # Session didn't complete
+                dropoffs[agg.max_step] += 1
         
         # Calculate dropoff rates
         dropoff_rates = {}
@@ -281,13 +420,21 @@ class AnalyticsService:
     def cleanup_old_events(self, days: int = 90) -> int:
         """Remove events older than specified days"""
         cutoff_time = time.time() - (days * 24 * 60 * 60)
-        original_count = len(self.events)
         
-        self.events = [e for e in self.events if e.timestamp >= cutoff_time]
+        # Events are in time order, so old ones form a prefix found by binary search
+        removed_count = bisect_left(self._timestamps, cutoff_time)
         
-        removed_count = original_count - len(self.events)
         if removed_count > 0:
-            self.save_events()
+            del self._timestamps[:removed_count]
+            del self._steps[:removed_count]
+            for column in self._cols.values():
+                del column[:removed_count]
+            del self._data[:removed_count]
+            # Rebuild the running totals from the events that are left
+            self._sessions.clear()
+            for i in range(len(self._timestamps)):
+                self._aggregate(i)
+            self.compact()
         
         return removed_count
 
@@ -5,7 +5,8 @@ Optimized Google Sheets operations with caching
 
 import logging
 import time
-from typing import List, Dict, Optional, Any
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any, Tuple
 from functools import lru_cache
 from services.sheets_service import SheetsService
 
@@ -25,13 +26,12 @@ class CachedSheetsService(SheetsService):
         super().__init__()
         self.cache_ttl = cache_ttl
         self.max_cache_size = max_cache_size
-        self._cache = {}
-        self._cache_timestamps = {}
-        self._access_times = {}  # Track last access time for LRU
+        # key -> (expiry time, value); order is LRU order (least recently used first)
+        self._cache: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
         
         logger.info(f"CachedSheetsService initialized with TTL: {cache_ttl}s, max size: {max_cache_size}")
     
-    def _get_cache_key(self, method: str, *args, **kwargs) -> str:
+    def _get_cache_key(self, method: str, *args, **kwargs) -> Tuple:
         """
         Generate cache key for method call
         
@@ -41,40 +41,13 @@ class CachedSheetsService(SheetsService):
             **kwargs: Method keyword arguments
             
         Returns:
-            str: Cache key
+            Tuple: Cache key (hashable as is, no string building)
         """
-        # Create a simple cache key from method name and arguments
-        key_parts = [method]
-        
-        # Add args to key
-        for arg in args:
-            key_parts.append(str(arg))
-        
-        # Add sorted kwargs to key
-        for key, value in sorted(kwargs.items()):
-            key_parts.append(f"{key}:{value}")
-        
-        return "|".join(key_parts)
-    
-    def _is_cache_valid(self, cache_key: str) -> bool:
-        """
-        Check if cache entry is still valid
-        
-        Args:
-            cache_key: Cache key to check
-            
-        Returns:
-            bool: True if cache is valid
-        """
-        if cache_key not in self._cache_timestamps:
-            return False
-        
-        now = time.time()
-        timestamp = self._cache_timestamps[cache_key]
-        
-        return (now - timestamp) < self.cache_ttl
+        if kwargs:
+            return (method, args, tuple(sorted(kwargs.items())))
+        return (method, args)
     
-    def _get_from_cache(self, cache_key: str) -> Optional[Any]:
+    def _get_from_cache(self, cache_key: Tuple) -> Optional[Any]:
         """
         Get value from cache if valid
         
@@ -84,65 +57,33 @@ class CachedSheetsService(SheetsService):
         Returns:
             Optional[Any]: Cached value or None
         """
-        if self._is_cache_valid(cache_key):
-            # Update access time for LRU
-            self._access_times[cache_key] = time.time()
-            logger.debug(f"Cache hit for key: {cache_key}")
-            return self._cache.get(cache_key)
-        
-        # Remove expired cache entry
-        if cache_key in self._cache:
+        entry = self._cache.get(cache_key)
+        if entry is not None:
+            if entry[0] > time.time():
+                # Mark as most recently used
+                self._cache.move_to_end(cache_key)
+                logger.debug(f"Cache hit for key: {cache_key}")
+                return entry[1]
+            # Remove expired cache entry
             del self._cache[cache_key]
-        if cache_key in self._cache_timestamps:
-            del self._cache_timestamps[cache_key]
-        if cache_key in self._access_times:
-            del self._access_times[cache_key]
         
         logger.debug(f"Cache miss for key: {cache_key}")
         return None
     
-    def _set_cache(self, cache_key: str, value: Any) -> None:
+    def _set_cache(self, cache_key: Tuple, value: Any) -> None:
         """
-        Set value in cache
+        Set value in cache, evicting the least recently used entry when full
         
         Args:
             cache_key: Cache key
             value: Value to cache
         """
-        # Check if we need to clean up cache
-        if len(self._cache) >= self.max_cache_size:
-            self._cleanup_cache()
-        
-        self._cache[cache_key] = value
-        self._cache_timestamps[cache_key] = time.time()
-        self._access_times[cache_key] = time.time()
+        self._cache[cache_key] = (time.time() + self.cache_ttl, value)
+        self._cache.move_to_end(cache_key)
+        if len(self._cache) > self.max_cache_size:
+            self._cache.popitem(last=False)
         logger.debug(f"Cached value for key: {cache_key}")
     
-    def _cleanup_cache(self) -> None:
-        """
-        Clean up cache using LRU (Least Recently Used) strategy
-        Removes 20% of the oldest entries
-        """
-        if len(self._cache) < self.max_cache_size:
-            return
-        
-        # Calculate how many items to remove (20% of max size)
-        items_to_remove = int(self.max_cache_size * 0.2)
-        
-        # Sort by access time (oldest first)
-        sorted_items = sorted(self._access_times.items(), key=lambda x: x[1])
-        
-        # Remove oldest items
-        for key, _ in sorted_items[:items_to_remove]:
-            if key in self._cache:
-                del self._cache[key]
-            if key in self._cache_timestamps:
-                del self._cache_timestamps[key]
-            if key in self._access_times:
-                del self._access_times[key]
-        
-        logger.info(f"Cleaned up {items_to_remove} cache entries")
-    
     def get_users_from_month(self, month_sheet: str) -> List[Dict]:
         """
         Get users from month sheet with caching
@@ -196,21 +137,25 @@ class CachedSheetsService(SheetsService):
             logger.error(f"Error getting status for user {telegram_id}: {e}")
             raise
     
-    def append_user_row(self, data: List[str]) -> None:
+    def append_user_row(self, data: List[str]) -> bool:
         """
         Append user row and invalidate relevant cache
         
         Args:
             data: User data to append
+            
+        Returns:
+            True if the row was written
         """
         try:
             # Append to sheets
-            super().append_user_row(data)
+            success = super().append_user_row(data)
             
             # Invalidate cache entries that might be affected
             self._invalidate_user_cache()
             
             logger.info("User row appended and cache invalidated")
+            return success
         except Exception as e:
             logger.error(f"Error appending user row: {e}")
             raise
@@ -229,11 +174,7 @@ class CachedSheetsService(SheetsService):
             super().update_status(telegram_id, reg_time, new_status)
             
             # Invalidate specific status cache
-            cache_key = self._get_cache_key("get_status", telegram_id, reg_time)
-            if cache_key in self._cache:
-                del self._cache[cache_key]
-            if cache_key in self._cache_timestamps:
-                del self._cache_timestamps[cache_key]
+            self._cache.pop(self._get_cache_key("get_status", telegram_id, reg_time), None)
             
             logger.info(f"Status updated for user {telegram_id} and cache invalidated")
         except Exception as e:
@@ -242,23 +183,16 @@ class CachedSheetsService(SheetsService):
     
     def _invalidate_user_cache(self) -> None:
         """Invalidate all user-related cache entries"""
-        keys_to_remove = []
-        
-        for key in self._cache.keys():
-            if "get_users_from_month" in key or "get_status" in key:
-                keys_to_remove.append(key)
+        keys_to_remove = [key for key in self._cache if key[0] in ("get_users_from_month", "get_status")]
         
         for key in keys_to_remove:
             del self._cache[key]
-            if key in self._cache_timestamps:
-                del self._cache_timestamps[key]
         
         logger.debug(f"Invalidated {len(keys_to_remove)} user-related cache entries")
     
     def clear_cache(self) -> None:
         """Clear all cache entries"""
         self._cache.clear()
-        self._cache_timestamps.clear()
         logger.info("All cache entries cleared")
     
     def get_cache_stats(self) -> Dict[str, Any]:
@@ -272,8 +206,8 @@ class CachedSheetsService(SheetsService):
         valid_entries = 0
         expired_entries = 0
         
-        for key, timestamp in self._cache_timestamps.items():
-            if (now - timestamp) < self.cache_ttl:
+        for expires_at, _ in self._cache.values():
+            if expires_at > now:
                 valid_entries += 1
             else:
                 expired_entries += 1
@@ -289,15 +223,10 @@ class CachedSheetsService(SheetsService):
     def cleanup_expired_cache(self) -> None:
         """Remove expired cache entries"""
         now = time.time()
-        keys_to_remove = []
-        
-        for key, timestamp in self._cache_timestamps.items():
-            if (now - timestamp) >= self.cache_ttl:
-                keys_to_remove.append(key)
+        keys_to_remove = [key for key, (expires_at, _) in self._cache.items() if expires_at <= now]
         
         for key in keys_to_remove:
             del self._cache[key]
-            del self._cache_timestamps[key]
         
         if keys_to_remove:
             logger.debug(f"Cleaned up {len(keys_to_remove)} expired cache entries")
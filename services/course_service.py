@@ -3,12 +3,23 @@ Course Service for KingSpeech Bot
 Handles course matching and recommendations
 """
 
+import atexit
+import heapq
 import json
 import os
-from typing import List, Dict, Optional
+import threading
+import time
+from typing import FrozenSet, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 from services.settings_service import settings
 
+LEVEL_ORDER = ("A0", "A1", "A2", "B1", "B2", "C1", "C2")
+LEVEL_INDEX = {level: i for i, level in enumerate(LEVEL_ORDER)}
+# Best score a course can get without matching the goal (level + format + schedule)
+MAX_SCORE_WITHOUT_GOAL = 30 + 20 + 10
+# Availability toggles are written to the catalog file at most this often
+SAVE_INTERVAL = 5.0
+
 
 @dataclass
 class Course:
@@ -34,8 +45,29 @@ class CourseService:
     def __init__(self, courses_file: str = "courses.json"):
         self.courses_file = courses_file
         self.courses: List[Course] = []
+        # Scoring rows for available courses: (course, goals, level index, format, schedules)
+        self._rows: List[Tuple[Course, FrozenSet[str], int, str, FrozenSet[str]]] = []
+        self._by_goal: Dict[str, List[int]] = {}
+        self._by_id: Dict[str, Course] = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self._save_timer: Optional[threading.Timer] = None
         self.load_courses()
     
+    def _build_index(self) -> None:
+        """Precompute the per-course lookup data (ID index and scoring rows)"""
+        self._by_id = {course.id: course for course in self.courses}
+        self._rows = [
+            (course, frozenset(course.goal), LEVEL_INDEX.get(course.level, -1),
+             course.format, frozenset(course.schedules))
+            for course in self.courses if course.available
+        ]
+        # Inverted index: goal -> positions in _rows, in catalog order
+        self._by_goal: Dict[str, List[int]] = {}
+        for i, row in enumerate(self._rows):
+            for goal in row[1]:
+                self._by_goal.setdefault(goal, []).append(i)
+    
     def load_courses(self) -> None:
         """Load courses from JSON file"""
         if os.path.exists(self.courses_file):
@@ -43,6 +75,7 @@ class CourseService:
                 with open(self.courses_file, 'r', encoding='utf-8') as f:
                     courses_data = json.load(f)
                     self.courses = [Course(**course) for course in courses_data]
+                self._build_index()
             except Exception as e:
                 print(f"Error loading courses: {e}")
                 self.create_default_courses()
@@ -115,10 +148,14 @@ class CourseService:
         ]
         
         self.courses = [Course(**course) for course in default_courses]
+        self._build_index()
         self.save_courses()
     
     def save_courses(self) -> None:
         """Save courses to JSON file"""
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
         try:
             courses_data = [
                 {
@@ -141,72 +178,91 @@ class CourseService:
             
             with open(self.courses_file, 'w', encoding='utf-8') as f:
                 json.dump(courses_data, f, ensure_ascii=False, indent=2)
+            self._dirty = False
+            self._last_save = time.monotonic()
         except Exception as e:
             print(f"Error saving courses: {e}")
     
+    def flush(self) -> None:
+        """Save pending availability changes"""
+        if self._dirty:
+            self.save_courses()
+    
     def get_courses_by_criteria(self, goal: str, level: str, format_pref: str, schedule: str) -> List[Course]:
         """Get courses matching user criteria"""
+        # Goal has the highest weight, so score the courses for this goal first.
+        # If the third best of them beats anything a course without the goal
+        # can reach, the other courses can't make the top 3.
+        candidates = self._by_goal.get(goal)
+        if candidates:
+            matches = self._top_matches([self._rows[i] for i in candidates], goal, level, format_pref, schedule)
+            if len(matches) == 3 and matches[2].score > MAX_SCORE_WITHOUT_GOAL:
+                return matches
+        return self._top_matches(self._rows, goal, level, format_pref, schedule)
+    
+    def _top_matches(self, rows: List[Tuple], goal: str, level: str, format_pref: str, schedule: str) -> List[Course]:
+        """Score the given course rows and return the top 3"""
+        user_level = LEVEL_INDEX.get(level, -1)
         matching_courses = []
         
-        for course in self.courses:
-            if not course.available:
-                continue
-                
+        for course, goals, course_level, course_format, schedules in rows:
             # Calculate match score
             score = 0
             
             # Goal matching (40% weight)
-            if goal in course.goal:
+            if goal in goals:
                 score += 40
             
-            # Level matching (30% weight)
+            # Level matching (30% weight); one level difference counts half
             if level == course.level:
                 score += 30
-            elif self._level_compatibility(level, course.level):
+            elif user_level >= 0 and course_level >= 0 and abs(user_level - course_level) <= 1:
                 score += 15
             
             # Format matching (20% weight)
-            if format_pref == course.format:
+            if format_pref == course_format:
                 score += 20
             
             # Schedule matching (10% weight)
-            if schedule in course.schedules:
+            if schedule in schedules:
                 score += 10
             
             if score > 0:
                 course.score = score
                 matching_courses.append(course)
         
-        # Sort by score (highest first)
-        matching_courses.sort(key=lambda x: x.score, reverse=True)
-        return matching_courses[:3]  # Return top 3 matches
+        # Top 3 matches by score (highest first, ties keep catalog order)
+        return heapq.nlargest(3, matching_courses, key=lambda x: x.score)
     
     def _level_compatibility(self, user_level: str, course_level: str) -> bool:
         """Check if user level is compatible with course level"""
-        level_order = ["A0", "A1", "A2", "B1", "B2", "C1", "C2"]
-        
-        try:
-            user_idx = level_order.index(user_level)
-            course_idx = level_order.index(course_level)
-            
-            # Allow one level difference
-            return abs(user_idx - course_idx) <= 1
-        except ValueError:
+        user_idx = LEVEL_INDEX.get(user_level)
+        course_idx = LEVEL_INDEX.get(course_level)
+        if user_idx is None or course_idx is None:
             return False
+        
+        # Allow one level difference
+        return abs(user_idx - course_idx) <= 1
     
     def get_course_by_id(self, course_id: str) -> Optional[Course]:
         """Get course by ID"""
-        for course in self.courses:
-            if course.id == course_id:
-                return course
-        return None
+        return self._by_id.get(course_id)
     
     def update_course_availability(self, course_id: str, available: bool) -> bool:
         """Update course availability"""
         course = self.get_course_by_id(course_id)
         if course:
             course.available = available
-            self.save_courses()
+            self._build_index()
+            # Bursts of toggles are written once; a trailing save writes the last of them
+            self._dirty = True
+            elapsed = time.monotonic() - self._last_save
+            if elapsed > SAVE_INTERVAL:
+                self.save_courses()
+            elif self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_INTERVAL - elapsed, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
             return True
         return False
     
@@ -218,3 +274,5 @@ class CourseService:
 
 # Global instance
 course_service = CourseService()
+# A pending trailing save would die with its daemon timer thread
+atexit.register(course_service.flush)
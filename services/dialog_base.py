@@ -45,6 +45,10 @@ class BaseDialog(ABC):
         """Get user data from context with fallback"""
         return context.get_variable(key, default)
     
+    def get_all_user_data(self, context: Context) -> Dict[str, Any]:
+        """Get all user data from context in a single call"""
+        return context.get_variables()
+    
     def set_user_data(self, context: Context, key: str, value: Any) -> None:
         """Set user data in context"""
         context.set_variable(key, value)
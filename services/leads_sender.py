@@ -61,6 +61,26 @@ class LeadsSenderService:
             print(f"❌ Ошибка отправки лида в чат: {e}")
             return False
     
+    async def send_message(self, chat_id: Any, text: str) -> bool:
+        """Асинхронно отправляет служебное сообщение в указанный чат"""
+        try:
+            if not chat_id:
+                return False
+            await self.bot.send_message(chat_id=chat_id, text=text)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка отправки сообщения в чат {chat_id}: {e}")
+            return False
+    
+    def send_message_sync(self, chat_id: Any, text: str) -> bool:
+        """Синхронная обертка для отправки сообщения"""
+        try:
+            loop = asyncio.get_event_loop()
+            return loop.run_until_complete(self.send_message(chat_id, text))
+        except RuntimeError:
+            # Если нет активного event loop, создаем новый
+            return asyncio.run(self.send_message(chat_id, text))
+    
     def send_lead_sync(self, lead_data: Dict[str, Any]) -> bool:
         """Синхронная обертка для отправки лида"""
         try:
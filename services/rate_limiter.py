@@ -5,12 +5,15 @@ Protection against spam and flood attacks
 
 import time
 import logging
-from collections import defaultdict
-from typing import Dict, List, Optional
+from typing import Optional
 from dataclasses import dataclass
 
+from cachetools import TTLCache
+
 logger = logging.getLogger(__name__)
 
+MAX_TRACKED_USERS = 100_000
+
 @dataclass
 class RateLimitConfig:
     """Configuration for rate limiting"""
@@ -19,15 +22,28 @@ class RateLimitConfig:
     cooldown_seconds: int = 300  # Cooldown period after limit exceeded
 
 class RateLimiter:
-    """Rate limiter for protecting against spam and flood attacks"""
+    """Token-bucket rate limiter for protecting against spam and flood attacks
+    
+    Each user has a bucket of max_requests tokens that refills at
+    max_requests / window_seconds tokens per second. Buckets and cooldowns
+    live in TTL caches, so idle users are dropped without a cleanup task.
+    """
     
     def __init__(self, config: Optional[RateLimitConfig] = None):
         self.config = config or RateLimitConfig()
-        self.requests: Dict[int, List[float]] = defaultdict(list)
-        self.blocked_users: Dict[int, float] = {}
+        self.capacity = float(self.config.max_requests)
+        self.refill_rate = self.capacity / self.config.window_seconds
+        # An idle bucket is full again after window_seconds, so it can be forgotten
+        self.buckets: TTLCache = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=self.config.window_seconds)
+        self.blocked_users: TTLCache = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=self.config.cooldown_seconds)
         
         logger.info(f"RateLimiter initialized: {self.config.max_requests} requests per {self.config.window_seconds}s")
     
+    def _tokens(self, user_id: int, now: float) -> float:
+        """Current token count for user after refilling up to now"""
+        tokens, last_refill = self.buckets.get(user_id, (self.capacity, now))
+        return min(self.capacity, tokens + (now - last_refill) * self.refill_rate)
+    
     def is_allowed(self, user_id: int) -> bool:
         """
         Check if user is allowed to make a request
@@ -38,40 +54,27 @@ class RateLimiter:
         Returns:
             bool: True if request is allowed, False if rate limited
         """
-        now = time.time()
-        
-        # Очищаем старые запросы в начале
-        if user_id in self.requests:
-            self.requests[user_id] = [req_time for req_time in self.requests[user_id] 
-                                    if now - req_time < self.config.window_seconds]
+        now = time.monotonic()
         
         # Проверяем cooldown
-        if user_id in self.blocked_users:
-            cooldown_remaining = now - self.blocked_users[user_id]
-            if cooldown_remaining < self.config.cooldown_seconds:
+        blocked_at = self.blocked_users.get(user_id)
+        if blocked_at is not None:
+            if now - blocked_at < self.config.cooldown_seconds:
                 logger.warning(f"User {user_id} is in cooldown period")
                 return False
-            else:
-                # Cooldown истек, удаляем из заблокированных и очищаем старые запросы
-                del self.blocked_users[user_id]
-                if user_id in self.requests:
-                    self.requests[user_id] = []
+            del self.blocked_users[user_id]
         
-        # Проверяем лимит запросов
-        current_requests = len(self.requests.get(user_id, []))
-        if current_requests >= self.config.max_requests:
-            logger.warning(f"Rate limit exceeded for user {user_id}: {current_requests} requests")
+        # Пополняем корзину и списываем токен
+        tokens = self._tokens(user_id, now)
+        if tokens < 1:
+            logger.warning(f"Rate limit exceeded for user {user_id}")
+            self.buckets[user_id] = (tokens, now)
             # Добавляем в cooldown только если cooldown_seconds > 0
             if self.config.cooldown_seconds > 0:
                 self.blocked_users[user_id] = now
-            # Если cooldown не настроен, просто блокируем до истечения окна
             return False
         
-        # Добавляем текущий запрос
-        if user_id not in self.requests:
-            self.requests[user_id] = []
-        self.requests[user_id].append(now)
-        
+        self.buckets[user_id] = (tokens - 1, now)
         return True
     
     def get_remaining_requests(self, user_id: int) -> int:
@@ -84,15 +87,7 @@ class RateLimiter:
         Returns:
             int: Number of remaining requests
         """
-        now = time.time()
-        user_requests = self.requests[user_id]
-        
-        # Remove old requests
-        user_requests = [req_time for req_time in user_requests 
-                        if now - req_time < self.config.window_seconds]
-        
-        remaining = max(0, self.config.max_requests - len(user_requests))
-        return remaining
+        return int(self._tokens(user_id, time.monotonic()))
     
     def get_cooldown_remaining(self, user_id: int) -> int:
         """
@@ -104,11 +99,12 @@ class RateLimiter:
         Returns:
             int: Remaining cooldown time in seconds, 0 if not blocked
         """
-        if user_id not in self.blocked_users:
+        blocked_at = self.blocked_users.get(user_id)
+        if blocked_at is None:
             return 0
         
-        now = time.time()
-        remaining = max(0, self.config.cooldown_seconds - (now - self.blocked_users[user_id]))
+        now = time.monotonic()
+        remaining = max(0, self.config.cooldown_seconds - (now - blocked_at))
         return int(remaining)
     
     def reset_user(self, user_id: int) -> None:
@@ -118,30 +114,9 @@ class RateLimiter:
         Args:
             user_id: Telegram user ID
         """
-        self.requests.pop(user_id, None)
+        self.buckets.pop(user_id, None)
         self.blocked_users.pop(user_id, None)
         logger.info(f"Rate limit reset for user {user_id}")
-    
-    def cleanup_old_data(self) -> None:
-        """Clean up old request data to prevent memory leaks"""
-        now = time.time()
-        cutoff_time = now - max(self.config.window_seconds, self.config.cooldown_seconds)
-        
-        # Clean up old requests
-        for user_id in list(self.requests.keys()):
-            user_requests = [req_time for req_time in self.requests[user_id] 
-                           if req_time > cutoff_time]
-            if user_requests:
-                self.requests[user_id] = user_requests
-            else:
-                del self.requests[user_id]
-        
-        # Clean up old blocked users
-        for user_id in list(self.blocked_users.keys()):
-            if self.blocked_users[user_id] < cutoff_time:
-                del self.blocked_users[user_id]
-        
-        logger.debug(f"Cleaned up old rate limit data")
 
 # Global rate limiter instance
 rate_limiter = RateLimiter()
@@ -0,0 +1,95 @@
+"""
+Session Store for KingSpeech Bot
+Redis-backed per-user dialog state, shared between bot workers and restarts
+"""
+
+import logging
+import os
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import msgpack
+    import redis.asyncio as aioredis
+except ImportError:  # optional: without them sessions stay in PTB's in-process user_data
+    msgpack = None
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = 3600
+KEY_PREFIX = "bot:s:"
+
+def step_tag(step: Optional[Callable]) -> str:
+    """Encode a dialog step (bound method or partial of one) as a short string tag"""
+    if step is None:
+        return ""
+    if isinstance(step, partial):
+        return f"{step.func.__name__}:{step.args[0]}"
+    return step.__name__
+
+@lru_cache(maxsize=256)
+def resolve_step(dialog: Any, tag: str) -> Optional[Callable]:
+    """Resolve a tag produced by step_tag back into a callable on the dialog instance.
+    
+    Dialogs are module-level singletons and their step set is fixed, so each
+    (dialog, tag) pair is resolved once and later restores are a cache hit.
+    """
+    if not tag or dialog is None:
+        return None
+    name, _, arg = tag.partition(":")
+    method = getattr(dialog, name, None)
+    if method is None:
+        logger.warning(f"Unknown dialog step tag: {tag}")
+        return None
+    return partial(method, arg) if arg else method
+
+class SessionStore:
+    """Stores {branch, step tag, msgpack-encoded variables} in a Redis hash per user"""
+
+    def __init__(self, url: Optional[str] = None, ttl: int = SESSION_TTL):
+        self.url = url if url is not None else os.getenv("REDIS_URL", "")
+        self.ttl = ttl
+        self._redis = None
+
+        if self.url and aioredis is None:
+            logger.warning("REDIS_URL is set but redis/msgpack are not installed - sessions stay in memory")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url) and aioredis is not None
+
+    def _client(self):
+        if self._redis is None:
+            self._redis = aioredis.from_url(self.url)
+        return self._redis
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Load a session; returns None if the user has no stored session"""
+        data = await self._client().hgetall(f"{KEY_PREFIX}{user_id}")
+        if not data:
+            return None
+        return {
+            "branch": data.get(b"branch", b"").decode(),
+            "step": data.get(b"step", b"").decode(),
+            "vars": msgpack.unpackb(data[b"vars"]) if b"vars" in data else {},
+        }
+
+    async def save(self, user_id: int, branch: Optional[str], step: str, variables: Dict[str, Any]) -> None:
+        """Save a session and refresh its TTL in one round-trip"""
+        key = f"{KEY_PREFIX}{user_id}"
+        async with self._client().pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={
+                "branch": branch or "",
+                "step": step,
+                "vars": msgpack.packb(variables, default=str),
+            })
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def delete(self, user_id: int) -> None:
+        """Drop a stored session"""
+        await self._client().delete(f"{KEY_PREFIX}{user_id}")
+
+# Global session store instance
+session_store = SessionStore()
@@ -26,6 +26,14 @@ class InputValidator:
     EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
     TELEGRAM_USERNAME_PATTERN = re.compile(r"^[a-zA-Z0-9_]{5,32}$")
     
+    # Patterns used for cleaning/sanitizing (compiled once instead of per call)
+    PHONE_STRIP_PATTERN = re.compile(r'[^\d+]')
+    SCRIPT_TAG_PATTERN = re.compile(r'<script.*?</script>', re.IGNORECASE | re.DOTALL)
+    HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+    CONTROL_CHARS_PATTERN = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+    INLINE_WHITESPACE_PATTERN = re.compile(r'[ \t]+')
+    NEWLINES_PATTERN = re.compile(r'\n+')
+    
     # Allowed characters for general text
     SAFE_TEXT_PATTERN = re.compile(r"^[а-яёa-z0-9\s\-_.,!?()@#$%&*+=:;\"'<>[\]{}|\\/]{1,1000}$", re.IGNORECASE)
     
@@ -90,7 +98,7 @@ class InputValidator:
         phone = phone.strip()
         
         # Remove all non-digit characters except +
-        cleaned_phone = re.sub(r'[^\d+]', '', phone)
+        cleaned_phone = self.PHONE_STRIP_PATTERN.sub('', phone)
         
         # Normalize phone number
         if cleaned_phone.startswith('8') and len(cleaned_phone) == 11:
@@ -223,17 +231,17 @@ class InputValidator:
             str: Sanitized text
         """
         # Remove potential script tags
-        text = re.sub(r'<script.*?</script>', '', text, flags=re.IGNORECASE | re.DOTALL)
+        text = self.SCRIPT_TAG_PATTERN.sub('', text)
         
         # Remove HTML tags
-        text = re.sub(r'<[^>]+>', '', text)
+        text = self.HTML_TAG_PATTERN.sub('', text)
         
         # Remove control characters but preserve spaces
-        text = re.sub(r'[\x00-\x1f\x7f-\x9f]', ' ', text)
+        text = self.CONTROL_CHARS_PATTERN.sub(' ', text)
         
         # Normalize whitespace (сохраняем пробелы)
-        text = re.sub(r'[ \t]+', ' ', text)
-        text = re.sub(r'\n+', '\n', text)
+        text = self.INLINE_WHITESPACE_PATTERN.sub(' ', text)
+        text = self.NEWLINES_PATTERN.sub('\n', text)
         
         return text.strip()
     
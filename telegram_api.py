@@ -0,0 +1,12 @@
+"""
+Telegram Bot API endpoint URLs
+"""
+
+from config import TELEGRAM_BOT_TOKEN
+
+# Base URL and endpoints are built once at import time
+_BASE = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+
+GET_ME = _BASE + "/getMe"
+GET_WEBHOOK_INFO = _BASE + "/getWebhookInfo"
+GET_UPDATES = _BASE + "/getUpdates"
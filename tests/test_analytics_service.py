@@ -0,0 +1,156 @@
+"""
+Tests for Analytics Service
+"""
+
+import pytest
+import time
+from services.analytics_service import AnalyticsService
+
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    """Analytics service with a few sessions at different funnel stages"""
+    service = AnalyticsService(events_file=str(tmp_path / "events.json"))
+
+    # Completed session: greeting -> thank you, contact and trial booked
+    for step in (1, 2, 3, 5):
+        service.track_event("step", "u1", "s1", funnel_step=step, goal="work", level="B1")
+    service.track_event("contact_submitted", "u1", "s1", funnel_step=5, goal="work", level="B1")
+    service.track_event("trial_booked", "u1", "s1", funnel_step=7, goal="work", level="B1")
+    service.track_event("step", "u1", "s1", funnel_step=8, goal="work", level="B1")
+
+    # Session dropped after goal selection
+    service.track_event("step", "u2", "s2", funnel_step=1)
+    service.track_event("step", "u2", "s2", funnel_step=2, goal="travel", level="A2")
+
+    # Session that went back a step and got materials
+    service.track_event("step", "u3", "s3", funnel_step=1, goal="work")
+    service.track_event("step", "u3", "s3", funnel_step=4, goal="work")
+    service.track_event("step", "u3", "s3", funnel_step=3, goal="work")
+    service.track_event("material_delivered", "u3", "s3", funnel_step=6, goal="work")
+    return service
+
+
+class TestAnalyticsService:
+    """Test cases for AnalyticsService"""
+
+    def test_funnel_analytics(self, analytics):
+        """Test funnel step counts, completion and conversion numbers"""
+        funnel = analytics.get_funnel_analytics()
+
+        assert funnel["total_sessions"] == 3
+        assert funnel["completed_sessions"] == 1
+        assert funnel["funnel_steps"] == {1: 3, 2: 2, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1, 8: 1}
+        assert funnel["contact_submissions"] == 1
+        assert funnel["material_downloads"] == 1
+        assert funnel["trial_bookings"] == 1
+        assert funnel["conversion_rates"]["contact_rate"] == pytest.approx(1 / 3)
+
+    def test_goal_and_level_analytics(self, analytics):
+        """Test grouping by goal and level"""
+        goals = analytics.get_goal_analytics()
+        assert goals == {
+            "work": {"contacts": 1, "materials": 1, "trials": 1, "session_count": 2},
+            "travel": {"contacts": 0, "materials": 0, "trials": 0, "session_count": 1},
+        }
+
+        levels = analytics.get_level_analytics()
+        assert levels["B1"]["session_count"] == 1
+        assert levels["B1"]["contacts"] == 1
+        assert levels["A2"]["session_count"] == 1
+
+    def test_dropoff_points(self, analytics):
+        """Test dropoff counts per max step reached"""
+        dropoffs = analytics.get_dropoff_points()
+
+        assert dropoffs["total_sessions"] == 3
+        assert dropoffs["dropoffs"] == {1: 0, 2: 1, 3: 0, 4: 0, 5: 0, 6: 1, 7: 0, 8: 0}
+        assert dropoffs["dropoff_rates"][2] == pytest.approx(1 / 3)
+        assert dropoffs["dropoff_rates"][6] == pytest.approx(1 / 2)
+
+    def test_user_journey_and_session(self, analytics):
+        """Test per-user and per-session views"""
+        journey = analytics.get_user_journey("u3")
+        assert [e.funnel_step for e in journey] == [1, 4, 3, 6]
+        assert journey[-1].event_type == "material_delivered"
+
+        session = analytics.get_session_analytics("s2")
+        assert session["user_id"] == "u2"
+        assert session["total_events"] == 2
+        assert session["funnel_progress"] == 2
+        assert analytics.get_session_analytics("missing") == {}
+
+    def test_period_filter(self, analytics, monkeypatch):
+        """Test that events outside the period are ignored"""
+        now = time.time()
+        analytics.track_event("step", "u4", "s4", funnel_step=1)
+
+        # Move the clock forward past the window of the earlier events
+        monkeypatch.setattr(time, "time", lambda: now + 10 * DAY)
+        assert analytics.get_funnel_analytics(days=1)["total_sessions"] == 0
+        assert analytics.get_funnel_analytics(days=30)["total_sessions"] == 4
+
+    def test_persistence_and_cleanup(self, analytics, monkeypatch):
+        """Test that events survive a reload and old ones are cleaned up"""
+        reloaded = AnalyticsService(events_file=analytics.events_file)
+        assert len(reloaded.events) == len(analytics.events)
+        assert reloaded.get_funnel_analytics() == analytics.get_funnel_analytics()
+        assert reloaded.cleanup_old_events(days=90) == 0
+
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 100 * DAY)
+        assert reloaded.cleanup_old_events(days=90) == len(analytics.events)
+        assert reloaded.events == []
+        assert AnalyticsService(events_file=analytics.events_file).events == []
+
+    def test_append_only_log(self, tmp_path):
+        """Test that events are appended as JSONL lines and legacy JSON files still load"""
+        legacy = tmp_path / "legacy.json"
+        legacy.write_text(
+            '[{"event_type": "step", "user_id": "u1", "session_id": "s1", '
+            '"timestamp": 1.0, "data": {}, "funnel_step": 1}]',
+            encoding="utf-8",
+        )
+        service = AnalyticsService(events_file=str(legacy))
+        assert len(service.events) == 1
+        # The legacy file is rewritten as JSONL, so appends to it stay readable
+        service.track_event("step", "u1", "s1", funnel_step=2)
+        assert len(legacy.read_text(encoding="utf-8").splitlines()) == 2
+        assert len(AnalyticsService(events_file=str(legacy)).events) == 2
+
+        log_file = tmp_path / "events.jsonl"
+        service = AnalyticsService(events_file=str(log_file))
+        with service.batch():
+            service.track_event("step", "u1", "s1", funnel_step=1)
+            service.track_event("step", "u1", "s1", funnel_step=2)
+        assert len(log_file.read_text(encoding="utf-8").splitlines()) == 2
+        assert [e.funnel_step for e in AnalyticsService(events_file=str(log_file)).events] == [1, 2]
+
+    def test_legacy_json_file_migrated(self, tmp_path):
+        """Test that history from the old .json file is carried over to a new .jsonl log"""
+        (tmp_path / "events.json").write_text(
+            '[{"event_type": "step", "user_id": "u1", "session_id": "s1", '
+            '"timestamp": 1.0, "data": {}, "funnel_step": 1}]',
+            encoding="utf-8",
+        )
+        log_file = tmp_path / "events.jsonl"
+        service = AnalyticsService(events_file=str(log_file))
+        assert len(service.events) == 1
+        assert len(log_file.read_text(encoding="utf-8").splitlines()) == 1
+
+        service.track_event("step", "u1", "s1", funnel_step=2)
+        assert [e.funnel_step for e in AnalyticsService(events_file=str(log_file)).events] == [1, 2]
+
+    def test_session_reported_whole(self, analytics, monkeypatch):
+        """Test that a session active in the period is reported with all of its events"""
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 10 * DAY)
+        analytics.track_event("step", "u2", "s2", funnel_step=3, goal="travel")
+
+        funnel = analytics.get_funnel_analytics(days=1)
+        assert funnel["total_sessions"] == 1
+        assert funnel["funnel_steps"] == {1: 1, 2: 1, 3: 1, 4: 0, 5: 0, 6: 0, 7: 0, 8: 0}
+        assert analytics.get_dropoff_points(days=1)["dropoffs"][3] == 1
+        assert analytics.get_goal_analytics(days=1)["travel"]["session_count"] == 1
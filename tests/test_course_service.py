@@ -0,0 +1,73 @@
+"""
+Tests for Course Service
+"""
+
+import pytest
+import time
+from services import course_service as course_service_module
+from services.course_service import CourseService
+
+
+@pytest.fixture
+def courses(tmp_path):
+    """Course service with the default catalog in a temporary file"""
+    return CourseService(courses_file=str(tmp_path / "courses.json"))
+
+
+class TestCourseService:
+    """Test cases for CourseService"""
+
+    def test_default_catalog_created(self, courses, tmp_path):
+        """Test that a missing catalog file is filled with default courses"""
+        assert len(courses.courses) == 5
+        assert (tmp_path / "courses.json").exists()
+
+    def test_courses_by_criteria_ranking(self, courses):
+        """Test weighted scoring and top-3 ordering"""
+        matches = courses.get_courses_by_criteria("business", "B2", "online", "evening")
+
+        assert [c.id for c in matches] == ["business_b2", "conversational_b1", "ielts_prep"]
+        assert [c.score for c in matches] == [100, 85, 60]
+
+    def test_courses_by_criteria_adjacent_level(self, courses):
+        """Test that a one-level difference gets partial level credit"""
+        matches = courses.get_courses_by_criteria("kids", "A2", "offline", "weekend")
+
+        assert matches[0].id == "kids_fun"
+        assert matches[0].score == 40 + 15 + 10
+
+    def test_unavailable_courses_skipped(self, courses):
+        """Test that unavailable courses are not recommended"""
+        assert courses.update_course_availability("business_b2", False) is True
+        matches = courses.get_courses_by_criteria("business", "B2", "online", "evening")
+
+        assert "business_b2" not in [c.id for c in matches]
+        assert courses.update_course_availability("missing", False) is False
+
+    def test_get_course_by_id(self, courses):
+        """Test lookup by course ID"""
+        assert courses.get_course_by_id("ielts_prep").name == "IELTS Preparation"
+        assert courses.get_course_by_id("missing") is None
+
+    def test_availability_saves_are_debounced(self, courses):
+        """Test that quick availability toggles are saved once and flushed on demand"""
+        courses.update_course_availability("kids_fun", False)
+        courses.update_course_availability("ielts_prep", False)
+
+        on_disk = CourseService(courses_file=courses.courses_file)
+        assert on_disk.get_course_by_id("kids_fun").available is True
+
+        courses.flush()
+        on_disk = CourseService(courses_file=courses.courses_file)
+        assert on_disk.get_course_by_id("kids_fun").available is False
+        assert on_disk.get_course_by_id("ielts_prep").available is False
+
+    def test_trailing_availability_save(self, courses, monkeypatch):
+        """Test that the last debounced toggle is written without an explicit flush"""
+        monkeypatch.setattr(course_service_module, "SAVE_INTERVAL", 0.05)
+        courses.update_course_availability("kids_fun", False)
+        courses.update_course_availability("ielts_prep", False)
+
+        time.sleep(0.2)
+        on_disk = CourseService(courses_file=courses.courses_file)
+        assert on_disk.get_course_by_id("ielts_prep").available is False
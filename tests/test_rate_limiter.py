@@ -117,8 +117,8 @@ class TestRateLimiter:
         # Should be allowed again
         assert limiter.is_allowed(user_id) is True
     
-    def test_cleanup_old_data(self, fast_rate_limiter):
-        """Test cleanup of old data"""
+    def test_idle_buckets_expire(self, fast_rate_limiter):
+        """Test that idle users are dropped without a cleanup pass"""
         user_id = 12345
         
         # Make some requests
@@ -128,10 +128,11 @@ class TestRateLimiter:
         # Wait for window to expire (0.1 seconds)
         time.sleep(0.15)
         
-        # Cleanup should remove old data
-        fast_rate_limiter.cleanup_old_data()
+        # Bucket should be evicted from the TTL cache
+        fast_rate_limiter.buckets.expire()
+        assert user_id not in fast_rate_limiter.buckets
         
-        # Should be allowed again after cleanup
+        # Should be allowed again
         assert fast_rate_limiter.is_allowed(user_id) is True
     
     def test_multiple_users_independent(self):
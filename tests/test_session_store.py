@@ -0,0 +1,58 @@
+"""
+Tests for Session Store step tag codec
+"""
+
+from functools import partial
+from services.session_store import SessionStore, step_tag, resolve_step
+
+class FakeDialog:
+    """Minimal dialog with a plain step and a parametrized step"""
+
+    def _process_name(self, context, choice=None):
+        return ("name", choice)
+
+    def _process(self, name, context, choice=None):
+        return (name, choice)
+
+class TestSessionStore:
+    """Test cases for SessionStore helpers"""
+
+    def test_step_tag_for_bound_method(self):
+        """Test that a bound method is encoded by its name"""
+        dialog = FakeDialog()
+        assert step_tag(dialog._process_name) == "_process_name"
+
+    def test_step_tag_for_partial(self):
+        """Test that a partial keeps its first argument in the tag"""
+        dialog = FakeDialog()
+        assert step_tag(partial(dialog._process, "level")) == "_process:level"
+
+    def test_step_tag_for_finished_dialog(self):
+        """Test that a missing step is encoded as an empty tag"""
+        assert step_tag(None) == ""
+
+    def test_resolve_step_round_trip(self):
+        """Test that resolved steps behave like the originals"""
+        dialog = FakeDialog()
+
+        step = resolve_step(dialog, step_tag(partial(dialog._process, "goal")))
+        assert step(None, choice="x") == ("goal", "x")
+
+        step = resolve_step(dialog, step_tag(dialog._process_name))
+        assert step(None, choice="Ivan") == ("name", "Ivan")
+
+    def test_resolve_step_unknown_or_empty(self):
+        """Test that unknown and empty tags resolve to None"""
+        dialog = FakeDialog()
+        assert resolve_step(dialog, "") is None
+        assert resolve_step(dialog, "_missing_step") is None
+        assert resolve_step(None, "_process_name") is None
+
+    def test_store_disabled_without_url(self):
+        """Test that the store is disabled when REDIS_URL is not configured"""
+        assert SessionStore(url="").enabled is False
+
+    def test_resolve_step_is_cached(self):
+        """Test that repeated resolves of a tag return the same callable"""
+        dialog = FakeDialog()
+        assert resolve_step(dialog, "_process:level") is resolve_step(dialog, "_process:level")